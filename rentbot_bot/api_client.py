@@ -0,0 +1,116 @@
+import asyncio
+import logging
+
+import httpx
+
+logger = logging.getLogger()
+
+# Методы, которые можно безопасно повторить после любой сетевой ошибки
+IDEMPOTENT_METHODS = {'GET', 'PUT', 'PATCH', 'DELETE'}
+RETRY_STATUSES = {429, 502, 503, 504}
+# Ответ, после которого можно повторить и POST: сервер не выполнял запрос.
+# После 502/503/504 запрос мог быть уже выполнен за прокси
+NOT_APPLIED_STATUSES = {429}
+
+
+class ApiError(Exception):
+    def __init__(self, status_code: int, content: bytes) -> None:
+        super().__init__(f'{status_code} {content!r}')
+        self.status_code = status_code
+        self.content = content
+
+
+# Общий асинхронный клиент API для обработчиков и задач бота: пул
+# keep-alive соединений, таймауты и повторы с экспоненциальной задержкой.
+# Медленный ответ API ждет только свой обработчик, а не весь цикл событий
+class ApiClient:
+    def __init__(self, base_url: str, timeout: float = 10, retries: int = 3,
+                 backoff: float = 0.5, pool_size: int = 20) -> None:
+        self.retries = retries
+        self.backoff = backoff
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=5),
+            limits=httpx.Limits(max_connections=pool_size,
+                                max_keepalive_connections=pool_size),
+        )
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, url, **kwargs)
+                retry_statuses = (RETRY_STATUSES if method in IDEMPOTENT_METHODS
+                                  else NOT_APPLIED_STATUSES)
+                if response.status_code not in retry_statuses or attempt >= self.retries:
+                    return response
+                logger.info(f'API {method} {url}: {response.status_code}, повтор')
+            except httpx.TransportError as e:
+                # POST повторяется, только если запрос не был отправлен
+                retriable = method in IDEMPOTENT_METHODS or isinstance(e, httpx.ConnectError)
+                if not retriable or attempt >= self.retries:
+                    raise
+                logger.info(f'API {method} {url}: {type(e).__name__}, повтор')
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    # Задачи
+
+    async def get_task_by_user(self, user_id: int) -> dict | None:
+        response = await self.request('GET', 'tasks/filter-by-user-id/',
+                                      params={'user_id': user_id})
+        if response.status_code != 200:
+            raise ApiError(response.status_code, response.content)
+        tasks = response.json()
+        return tasks[0] if tasks else None
+
+    async def list_tasks(self) -> list[dict]:
+        response = await self.request('GET', 'tasks/')
+        if response.status_code != 200:
+            raise ApiError(response.status_code, response.content)
+        return response.json()
+
+    async def create_task(self, task: dict) -> dict:
+        response = await self.request('POST', 'tasks/', json=task)
+        if response.status_code != 201:
+            raise ApiError(response.status_code, response.content)
+        return response.json()
+
+    async def update_task(self, task_id: int, **fields) -> dict:
+        response = await self.request('PATCH', f'tasks/{task_id}/', json=fields)
+        if response.status_code != 200:
+            raise ApiError(response.status_code, response.content)
+        return response.json()
+
+    # True - задача удалена, False - задачи не было
+    async def delete_task_by_user(self, user_id: int) -> bool:
+        response = await self.request('DELETE', 'tasks/delete-by-user-id/',
+                                      params={'user_id': user_id})
+        if response.status_code == 204:
+            return True
+        if response.status_code == 404:
+            return False
+        raise ApiError(response.status_code, response.content)
+
+    # Объявления
+
+    # Страница объявлений: {'results', 'next_cursor', 'has_more'}
+    async def get_apartments(self, params: dict) -> dict:
+        response = await self.request('GET', 'apartments/', params=params)
+        if response.status_code != 200:
+            raise ApiError(response.status_code, response.content)
+        return response.json()
+
+    # Новые объявления по всем готовым задачам, сгруппированные по задачам:
+    # {'results', 'apartments', 'next_cursor', 'has_more'}
+    async def get_matches(self, cursor: str | None, limit: int) -> dict:
+        params = {'limit': limit}
+        if cursor:
+            params['cursor'] = cursor
+        response = await self.request('GET', 'apartments/matches/', params=params)
+        if response.status_code != 200:
+            raise ApiError(response.status_code, response.content)
+        return response.json()
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from photo_cache import photo_cache
+from sender import send_listings_to
+
+logger = logging.getLogger()
+
+# Файл с курсором диспетчера: после перезапуска рассылка продолжается
+# с места остановки
+STATE_FILE = os.getenv('DISPATCHER_STATE_FILE', '/app/rentbot_bot/dispatcher_state.json')
+# Интервал опроса API в секундах
+INTERVAL = int(os.getenv('DISPATCHER_INTERVAL', 60))
+# Пользователей, которым сообщения отправляются одновременно. Темп
+# отправки задает ограничитель бота, здесь - только размер очереди
+CONCURRENCY = int(os.getenv('DISPATCHER_CONCURRENCY', 50))
+# Объявлений в одном ответе /apartments/matches/ (максимум API)
+PAGE_LIMIT = 500
+# Окно свежести API в секундах: курсор, сохраненный раньше, после
+# перезапуска не используется, как и позиция задач в restore_tasks
+MAX_CURSOR_AGE = 30 * 60
+
+
+def load_state():
+    try:
+        with open(STATE_FILE, encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(f'Не удалось прочитать состояние диспетчера: {e}')
+        return None
+    # Бот простаивал дольше окна свежести: объявления за время простоя
+    # не рассылаются, курсор доводится до последнего объявления заново
+    if time.time() - state.get('saved_at', 0) > MAX_CURSOR_AGE:
+        logger.info('Курсор диспетчера устарел и будет инициализирован заново')
+        return None
+    return state
+
+
+def save_state(state):
+    tmp_path = f'{STATE_FILE}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, STATE_FILE)
+
+
+async def deliver(bot, semaphore, user_id, listings):
+    async with semaphore:
+        try:
+            await send_listings_to(bot, user_id, listings)
+        except Exception:
+            logger.exception(f'Ошибка отправки объявлений пользователю {user_id}')
+
+
+# Рассылка одной страницы совпадений: объявления одного пользователя
+# уходят по порядку, разные пользователи обслуживаются параллельно
+async def fan_out(bot, page, semaphore):
+    apartments = {apartment['id']: apartment for apartment in page['apartments']}
+    await asyncio.gather(*(
+        deliver(bot, semaphore, result['user_id'],
+                [apartments[pk] for pk in result['apartments'] if pk in apartments])
+        for result in page['results']))
+
+
+# Один проход диспетчера: новые объявления по всем готовым задачам
+# запрашиваются у API страницами, уже сопоставленными с задачами.
+# Число запросов к API не зависит от числа пользователей
+async def dispatch(bot, api):
+    state = load_state()
+    cursor = state.get('cursor') if state else None
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    sent = 0
+    while True:
+        page = await api.get_matches(cursor, PAGE_LIMIT)
+        # Без сохраненного курсора (первый запуск) ничего не отправляется:
+        # курсор только доводится до последнего объявления
+        if state is not None:
+            await fan_out(bot, page, semaphore)
+            sent += sum(len(result['apartments']) for result in page['results'])
+        if page['next_cursor']:
+            cursor = page['next_cursor']
+        save_state({'cursor': cursor, 'saved_at': time.time()})
+        if not page['has_more']:
+            break
+
+    photo_cache.save()
+    if state is None:
+        logger.info('Курсор диспетчера инициализирован')
+    else:
+        logger.info(f'Диспетчер отправил {sent} объявлений, '
+                    f'в очереди отправки {bot.rate_limiter.queue_depth}')
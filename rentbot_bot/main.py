@@ -1,8 +1,6 @@
 import logging
 import os
-import sys
 import re
-import requests
 from datetime import datetime, timedelta, timezone
 import pytz
 from dateutil import parser
@@ -13,6 +11,11 @@ from telegram.ext import (
 )
 from dotenv import load_dotenv
 
+from api_client import ApiClient, ApiError
+import dispatcher
+from photo_cache import photo_cache
+from rate_limiter import PriorityRateLimiter
+from sender import send_listings_to
 from dict import (cities, districts_belgrade, districts_novisad,
                   property_types, reporters, rooms, sizes)
 
@@ -20,8 +23,9 @@ load_dotenv()
 
 TOKEN = os.getenv('TOKEN')
 API_URL = os.getenv('API_URL')
-ADV_API_URL = f'{API_URL}apartments/'
-TASK_API_URL = f'{API_URL}tasks/'
+# dispatcher - одно общее задание рассылки для всех пользователей,
+# jobs - отдельное задание JobQueue на каждого пользователя
+DISPATCH_MODE = os.getenv('DISPATCH_MODE', 'dispatcher')
 LOG_LEVEL = logging.INFO if os.getenv('LOG_LEVEL') == 'INFO' else logging.ERROR
 
 # !!! Настроить ротацию логов и именование файлов с учетом даты
@@ -34,10 +38,15 @@ logging.basicConfig(filename=log_file_path, level=LOG_LEVEL,
                     encoding='utf-8')
 logger = logging.getLogger()
 
+# Один клиент API с пулом соединений на все обработчики и задания
+api = ApiClient(API_URL)
+
 # Состояния фильтров
 SELECTING_FILTER, SELECTING_CITY, SELECTING_REPORTER, SELECTING_SIZE, SELECTING_MIN_PRICE, SELECTING_MAX_PRICE, SELECTING_DISTRICT, SELECTING_PROPERTY_TYPE, SELECTING_ROOMS, CONFIRMATION = range(10)
 # Интервал отправки сообщений в секундах
 INTERVAL = 10 * 60
+# Максимальное количество объявлений в одном ответе API
+PAGE_LIMIT = 100
 
 
 def generate_keyboard(options, selected_options):
@@ -116,40 +125,41 @@ async def start(update: Update, context: CallbackContext):
     context.user_data.clear()
     # Проверка наличия задачи в базе данных
     # !!! возможно, что стоит проверять задание в JobQueue
-    task_response = requests.get(f'{TASK_API_URL}filter-by-user-id?user_id={user_id}')
-    if task_response.status_code == 200:
-        tasks = task_response.json()
-        if tasks:
-            task = tasks[0]
-            context.user_data['selected_city'] = [task.get('city', '')]
-            context.user_data['selected_reporters'] = task.get('reporters', [])
-            context.user_data['selected_sizes'] = task.get('sizes', [])
-            context.user_data['min_price'] = task.get('min_price')
-            context.user_data['max_price'] = task.get('max_price')
-            context.user_data['selected_districts'] = task.get('districts', [])
-            context.user_data['selected_property_types'] = task.get('property_types', [])
-            context.user_data['selected_rooms'] = task.get('rooms', [])
-            reply_markup = generate_filter_menu(context)
-
-            if update.message:
-                await update.message.reply_text(
-                    '''
+    try:
+        task = await api.get_task_by_user(user_id)
+    except Exception as e:
+        logger.error(f'Ошибка получения задачи для user_id {user_id}: {e}')
+        task = None
+    if task:
+        context.user_data['selected_city'] = [task.get('city', '')]
+        context.user_data['selected_reporters'] = task.get('reporters', [])
+        context.user_data['selected_sizes'] = task.get('sizes', [])
+        context.user_data['min_price'] = task.get('min_price')
+        context.user_data['max_price'] = task.get('max_price')
+        context.user_data['selected_districts'] = task.get('districts', [])
+        context.user_data['selected_property_types'] = task.get('property_types', [])
+        context.user_data['selected_rooms'] = task.get('rooms', [])
+        reply_markup = generate_filter_menu(context)
+
+        if update.message:
+            await update.message.reply_text(
+                '''
 Поиск объявлений уже идет.
 Текущие критерии поиска:
-                    ''',
-                    reply_markup=reply_markup
-                )
-            elif update.callback_query:
-                query = update.callback_query
-                await query.answer()
-                await query.edit_message_text(
-                    '''
+                ''',
+                reply_markup=reply_markup
+            )
+        elif update.callback_query:
+            query = update.callback_query
+            await query.answer()
+            await query.edit_message_text(
+                '''
 Поиск объявлений уже идет.
 Текущие критерии поиска:
-                    ''',
-                    reply_markup=reply_markup
-                )
-            return SELECTING_FILTER
+                ''',
+                reply_markup=reply_markup
+            )
+        return SELECTING_FILTER
 
     # Если задачи не найдено или создана новая, начинаем выбор фильтров
     await begin_selection(update, context)
@@ -475,45 +485,45 @@ async def start_search(update: Update, context: CallbackContext):
         job.schedule_removal()
 
     # Удаляем текущую задачу из базы данных
-    task_response = requests.delete(f'{TASK_API_URL}delete-by-user-id?user_id={user_id}')
-    if task_response.status_code == 204:
-        logger.info(f'Задача для user_id {user_id} успешно удалена')
-    elif task_response.status_code != 404:
-        logger.error(f'Ошибка удаления задачи для user_id {user_id}: {task_response.status_code} {task_response.content}')
+    try:
+        if await api.delete_task_by_user(user_id):
+            logger.info(f'Задача для user_id {user_id} успешно удалена')
+    except Exception as e:
+        logger.error(f'Ошибка удаления задачи для user_id {user_id}: {e}')
 
     # Создание новой задачи с обновленными критериями
-    response = requests.post(TASK_API_URL, json={
-        'user_id': user_id,
-        'city': selected_city,
-        'interval': INTERVAL,
-        'reporters': context.user_data['selected_reporters'],
-        'sizes': context.user_data['selected_sizes'],
-        'min_price': context.user_data['min_price'],
-        'max_price': context.user_data['max_price'],
-        'districts': context.user_data['selected_districts'],
-        'property_types': context.user_data['selected_property_types'],
-        'rooms': context.user_data['selected_rooms'],
-        'isReady': True
-    })
-    if response.status_code != 201:
-        logger.error(f'Ошибка добавления задачи в API: {response.status_code} {response.content}')
+    try:
+        task = await api.create_task({
+            'user_id': user_id,
+            'city': selected_city,
+            'interval': INTERVAL,
+            'reporters': context.user_data['selected_reporters'],
+            'sizes': context.user_data['selected_sizes'],
+            'min_price': context.user_data['min_price'],
+            'max_price': context.user_data['max_price'],
+            'districts': context.user_data['selected_districts'],
+            'property_types': context.user_data['selected_property_types'],
+            'rooms': context.user_data['selected_rooms'],
+            'isReady': True
+        })
+    except Exception as e:
+        logger.error(f'Ошибка добавления задачи в API: {e}')
         return ConversationHandler.END
-    else:
-        task = response.json()
-        last_sent_date = None
-
-    # Добавление нового задания в JobQueue
-    context.application.job_queue.run_repeating(send_listings, interval=INTERVAL, data={
-        'user_id': user_id,
-        'selected_city': selected_city,
-        'selected_reporters': context.user_data['selected_reporters'],
-        'selected_sizes': context.user_data['selected_sizes'],
-        'min_price': context.user_data['min_price'],
-        'max_price': context.user_data['max_price'],
-        'selected_districts': context.user_data['selected_districts'],
-        'selected_property_types': context.user_data['selected_property_types'],
-        'selected_rooms': context.user_data['selected_rooms']
-    }, name=str(user_id))
+
+    # Добавление нового задания в JobQueue. В режиме диспетчера задача
+    # подхватывается общим заданием рассылки
+    if DISPATCH_MODE == 'jobs':
+        context.application.job_queue.run_repeating(send_listings, interval=INTERVAL, data={
+            'user_id': user_id,
+            'selected_city': selected_city,
+            'selected_reporters': context.user_data['selected_reporters'],
+            'selected_sizes': context.user_data['selected_sizes'],
+            'min_price': context.user_data['min_price'],
+            'max_price': context.user_data['max_price'],
+            'selected_districts': context.user_data['selected_districts'],
+            'selected_property_types': context.user_data['selected_property_types'],
+            'selected_rooms': context.user_data['selected_rooms']
+        }, name=str(user_id))
 
     # Формирование текста с фильтрами
     filter_text = f"✅ Начинаю поиск по условиям:\n"
@@ -532,24 +542,18 @@ async def send_listings(context: CallbackContext):
     job = context.job
     user_id = job.data['user_id']
     selected_city = job.data['selected_city']
-    selected_reporters = job.data['selected_reporters']
-    selected_sizes = job.data['selected_sizes']
-    min_price = job.data['min_price']
-    max_price = job.data['max_price']
-    selected_districts = job.data['selected_districts']
-    selected_property_types = job.data['selected_property_types']
-    selected_rooms = job.data['selected_rooms']
 
     try:
         # Проверяем сохранилось ли состояние пользователя в БД
-        task_response = requests.get(f'{TASK_API_URL}filter-by-user-id?user_id={user_id}')
-        if task_response.status_code != 200 or not task_response.json():
+        try:
+            task = await api.get_task_by_user(user_id)
+        except ApiError:
+            task = None
+        if not task:
             logger.error(f'Задача для user_id {user_id} не найдена.')
             job.schedule_removal()
             return
 
-        tasks = task_response.json()
-        task = tasks[0]
         if not task.get('isReady'):
             logger.info(f'Задача для user_id {user_id} не готова для выполнения.')
             return
@@ -558,66 +562,40 @@ async def send_listings(context: CallbackContext):
         if last_sent_date:
             last_sent_date = parser.isoparse(last_sent_date)
 
-        params = {
-            'city': selected_city,
-            'last_sent_date': last_sent_date.strftime('%Y-%m-%d %H:%M:%S') if last_sent_date else '',
-        }
-
-        if selected_reporters:
-            params['reporters'] = selected_reporters
-        if selected_sizes:
-            params['sizes'] = selected_sizes
-        if min_price:
-            params['min_price'] = min_price
-        if max_price:
-            params['max_price'] = max_price
-        if selected_districts:
-            params['districts'] = selected_districts
-        if selected_property_types:
-            params['property_types'] = selected_property_types
-        if selected_rooms:
-            params['rooms'] = selected_rooms
-
-        response = requests.get(ADV_API_URL, params=params)
-        if response.status_code == 200:
-            listings = response.json()
+        # Продолжаем с курсора, сохраненного после прошлой отправки;
+        # без курсора (новая задача) - с даты last_sent_date
+        cursor = task.get('cursor')
+        # Фильтры хранятся в задаче на стороне API, передается только ее id
+        params = {'task': task['id'], 'limit': PAGE_LIMIT}
+        if cursor:
+            params['cursor'] = cursor
+        else:
+            params['last_sent_date'] = last_sent_date.strftime('%Y-%m-%d %H:%M:%S') if last_sent_date else ''
+
+        new_cursor = cursor
+        while True:
+            try:
+                page = await api.get_apartments(params)
+            except ApiError as e:
+                logger.error(f'Ошибка получения объявлений для города {selected_city}: {e}')
+                break
+
+            listings = page['results']
             logger.info(f'Получено {len(listings)} объявлений для города {selected_city}')
-            new_listings = listings
-            max_inserted_at = last_sent_date
-
-            if new_listings:
-                for listing in new_listings:
-                    reply_text = (
-                        f"<b>{listing['city']}, {listing['district']}</b>\n"
-                        f"{listing['type']}, <b>{listing['size']} m2</b>\n"
-                        f"Количество комнат: <b>{listing['rooms']}</b>\n"
-                        f"Разместил: <b>{listing['reporter']}</b>\n\n"
-                        f"<b>{listing['price']} {listing['currency']}</b>\n\n"
-                        f"<i>от {listing['published']}</i>\n"
-                        f"Источник: <a href='{listing['url']}'>{listing['src']}</a>"
-                    )
-                    image_url = listing['image_url']
-
-                    if image_url:
-                        try:
-                            await context.bot.send_photo(chat_id=job.data['user_id'], photo=image_url, caption=reply_text, parse_mode='HTML')
-                        except Exception as e:
-                            logger.error(f'Ошибка отправки фото: {e}')
-                            await context.bot.send_message(chat_id=job.data['user_id'], text=reply_text, parse_mode='HTML')
-                    else:
-                        await context.bot.send_message(chat_id=job.data['user_id'], text=reply_text, parse_mode='HTML')
-
-                    inserted_at = parser.isoparse(listing['insertedAt'])
-                    if inserted_at > max_inserted_at:
-                        max_inserted_at = inserted_at
-
-                if max_inserted_at > last_sent_date:
-                    new_last_sent_date = max_inserted_at + timedelta(seconds=1)
-                    requests.patch(f"{TASK_API_URL}{task['id']}/", json={'last_sent_date': new_last_sent_date.isoformat()})
-            else:
+            if not listings:
                 logger.info(f'Нет новых объявлений для города {selected_city}')
-        else:
-            logger.error(f'Ошибка получения объявлений для города {selected_city}: {response.status_code} {response.content}')
+
+            await send_listings_to(context.bot, user_id, listings)
+
+            if page['next_cursor']:
+                new_cursor = page['next_cursor']
+                params['cursor'] = new_cursor
+                params.pop('last_sent_date', None)
+            if not page['has_more']:
+                break
+
+        if new_cursor != cursor:
+            await api.update_task(task['id'], cursor=new_cursor)
     except Exception:
         logger.exception(f'Произошла ошибка при получении объявлений для города {selected_city}')
 
@@ -649,11 +627,11 @@ async def stop(update: Update, context: CallbackContext):
         logger.info(f'Удаление джоба {user_id}')
         job.schedule_removal()
 
-    response = requests.delete(f'{TASK_API_URL}delete-by-user-id?user_id={user_id}')
-    if response.status_code == 404:
-        logger.info(f'Задача для user_id {user_id} не найдена.')
-    elif response.status_code != 204:
-        logger.error(f'Ошибка удаления задачи из API: {response.status_code} {response.content}')
+    try:
+        if not await api.delete_task_by_user(user_id):
+            logger.info(f'Задача для user_id {user_id} не найдена.')
+    except Exception as e:
+        logger.error(f'Ошибка удаления задачи из API: {e}')
 
     # !!! Переделать логику так, чтобы при /stop сохранялись фильтры в БД
     # Можно зацепиться за поле isReady
@@ -676,46 +654,71 @@ async def reset(update: Update, context: CallbackContext):
         logger.info(f'Удаление джоба {user_id}')
         job.schedule_removal()
 
-    response = requests.delete(f'{TASK_API_URL}delete-by-user-id?user_id={user_id}')
-    if response.status_code == 404:
-        logger.info(f'Задача для user_id {user_id} не найдена.')
-    elif response.status_code != 204:
-        logger.error(f'Ошибка удаления задачи из API: {response.status_code} {response.content}')
+    try:
+        if not await api.delete_task_by_user(user_id):
+            logger.info(f'Задача для user_id {user_id} не найдена.')
+    except Exception as e:
+        logger.error(f'Ошибка удаления задачи из API: {e}')
 
     # Возвращение к начальному состоянию
     await begin_selection(update, context)
     return SELECTING_FILTER
 
 
-# Восстановить задачи из БД
-def restore_tasks(job_queue):
-    response = requests.get(TASK_API_URL)
-    if response.status_code == 200:
-        tasks = response.json()
-        for task in tasks:
-            if task['isReady']:
-                job_queue.run_repeating(send_listings, interval=task['interval'], data={
-                    'user_id': task['user_id'],
-                    'selected_city': task['city'],
-                    'selected_reporters': task['reporters'],
-                    'selected_sizes': task['sizes'],
-                    'min_price': task['min_price'],
-                    'max_price': task['max_price'],
-                    'selected_districts': task['districts'],
-                    'selected_property_types': task['property_types'],
-                    'selected_rooms': task['rooms']
-                }, name=str(task['user_id']))
+# Восстановить задачи из БД при запуске приложения
+async def restore_tasks(application: Application):
+    try:
+        tasks = await api.list_tasks()
+    except Exception as e:
+        logger.error(f'Ошибка получения задач из API: {e}')
+        raise RuntimeError('Не удалось восстановить задачи из API') from e
+
+    for task in tasks:
+        if task['isReady']:
+            application.job_queue.run_repeating(send_listings, interval=task['interval'], data={
+                'user_id': task['user_id'],
+                'selected_city': task['city'],
+                'selected_reporters': task['reporters'],
+                'selected_sizes': task['sizes'],
+                'min_price': task['min_price'],
+                'max_price': task['max_price'],
+                'selected_districts': task['districts'],
+                'selected_property_types': task['property_types'],
+                'selected_rooms': task['rooms']
+            }, name=str(task['user_id']))
+            # Задача с курсором продолжит отправку с места остановки
+            if not task.get('cursor'):
                 belgrade_tz = pytz.timezone('Europe/Belgrade')
                 new_last_sent_date = datetime.now(belgrade_tz) + timedelta(seconds=1)
-                requests.patch(f"{TASK_API_URL}{task['id']}/", json={'last_sent_date': new_last_sent_date.isoformat()})
+                await api.update_task(task['id'], last_sent_date=new_last_sent_date.isoformat())
+
+
+async def dispatch_listings(context: CallbackContext):
+    try:
+        await dispatcher.dispatch(context.bot, api)
+    except Exception:
+        logger.exception('Ошибка рассылки объявлений диспетчером')
+
+
+async def post_init(application: Application):
+    photo_cache.load()
+    if DISPATCH_MODE == 'jobs':
+        await restore_tasks(application)
     else:
-        logger.error(f'Ошибка получения задач из API: {response.status_code} {response.content}')
-        sys.exit(1)
+        application.job_queue.run_repeating(dispatch_listings, interval=dispatcher.INTERVAL,
+                                            first=1, name='dispatcher')
+
+
+async def post_shutdown(application: Application):
+    photo_cache.save()
+    await api.close()
 
 
 def main():
     job_queue = JobQueue()
-    application = Application.builder().token(TOKEN).job_queue(job_queue).build()
+    application = (Application.builder().token(TOKEN).job_queue(job_queue)
+                   .rate_limiter(PriorityRateLimiter())
+                   .post_init(post_init).post_shutdown(post_shutdown).build())
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('start', start),
@@ -784,11 +787,6 @@ def main():
 
     application.add_handler(conv_handler)
 
-    job_queue.set_application(application)
-    job_queue.start()
-
-    restore_tasks(job_queue)
-
     application.run_polling()
 
 
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+# Сколько file_id хранить и как долго ими пользоваться
+MAX_SIZE = int(os.getenv('PHOTO_CACHE_SIZE', 10000))
+TTL = int(os.getenv('PHOTO_CACHE_TTL', 7 * 24 * 60 * 60))
+# Файл, в котором кэш переживает перезапуск бота; пусто - только в памяти
+CACHE_FILE = os.getenv('PHOTO_CACHE_FILE', '/app/rentbot_bot/photo_cache.json')
+
+
+# image_url -> file_id фото, уже загруженного в Telegram. Повторная отправка
+# того же объявления другим пользователям идет по file_id, и Telegram не
+# скачивает картинку с сайта заново. Вытесняются давно не использованные
+# и устаревшие записи
+class PhotoCache:
+    def __init__(self, max_size=MAX_SIZE, ttl=TTL, path=CACHE_FILE):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        # image_url -> (file_id, время сохранения)
+        self._items = OrderedDict()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, image_url):
+        item = self._items.get(image_url)
+        if item is None:
+            return None
+        file_id, stored_at = item
+        if time.time() - stored_at > self.ttl:
+            self.discard(image_url)
+            return None
+        self._items.move_to_end(image_url)
+        return file_id
+
+    def put(self, image_url, file_id):
+        self._items[image_url] = (file_id, time.time())
+        self._items.move_to_end(image_url)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        self._dirty = True
+
+    def discard(self, image_url):
+        if self._items.pop(image_url, None) is not None:
+            self._dirty = True
+
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f'Не удалось прочитать кэш фото: {e}')
+            return
+        now = time.time()
+        # В файле записи лежат от давно использованных к недавним
+        for image_url, file_id, stored_at in items[-self.max_size:]:
+            if now - stored_at <= self.ttl:
+                self._items[image_url] = (file_id, stored_at)
+        logger.info(f'Загружено {len(self._items)} file_id фото')
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        items = [[image_url, file_id, stored_at]
+                 for image_url, (file_id, stored_at) in self._items.items()]
+        try:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(items, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.error(f'Не удалось сохранить кэш фото: {e}')
+
+
+photo_cache = PhotoCache()
@@ -0,0 +1,145 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger()
+
+# Приоритеты запросов (rate_limit_args): ответы пользователю уходят
+# раньше накопившихся уведомлений об объявлениях
+INTERACTIVE = 0
+NOTIFICATION = 1
+
+# Общий лимит Telegram - около 30 сообщений в секунду
+GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+# Не чаще одного уведомления в секунду в личный чат и 20 в минуту в группу
+PRIVATE_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', 1))
+GROUP_CHAT_INTERVAL = 3
+MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', 3))
+BACKOFF = 1
+
+
+# Ограничитель исходящих запросов бота: общий token bucket, очередь с
+# приоритетами и выдержка между уведомлениями в один чат. RetryAfter
+# приостанавливает всю отправку на указанное время, затем запрос повторяется
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    __slots__ = ('rate', 'max_retries', '_tokens', '_updated', '_paused_until',
+                 '_queue', '_counter', '_wakeup', '_worker', '_chat_slots', '_pacing')
+
+    def __init__(self, rate: float = GLOBAL_RATE, max_retries: int = MAX_RETRIES) -> None:
+        self.rate = rate
+        self.max_retries = max_retries
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # Куча (приоритет, номер, стоимость, future) ожидающих общего лимита запросов
+        self._queue = []
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._worker = None
+        # chat_id -> время, с которого в чат можно отправить следующее уведомление
+        self._chat_slots = {}
+        # Запросов, ожидающих своей очереди в чате
+        self._pacing = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue) + self._pacing
+
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for _, _, _, future in self._queue:
+            future.cancel()
+        self._queue.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = INTERACTIVE if rate_limit_args is None else rate_limit_args
+        chat_id = data.get('chat_id')
+        # Альбом считается за столько сообщений, сколько в нем фото
+        cost = len(data.get('media') or ()) if endpoint == 'sendMediaGroup' else 1
+
+        if priority != INTERACTIVE and chat_id is not None:
+            await self._wait_chat_slot(chat_id)
+
+        attempt = 0
+        while True:
+            # Запросы без чата (answerCallbackQuery и т.п.) не считаются сообщениями
+            if chat_id is not None:
+                await self._acquire(priority, max(cost, 1))
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = e.retry_after + BACKOFF * 2 ** attempt
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f'Telegram RetryAfter для {endpoint}: пауза {delay:.1f} с, '
+                               f'в очереди {self.queue_depth}')
+                attempt += 1
+                if chat_id is None:
+                    await asyncio.sleep(delay)
+
+    async def _wait_chat_slot(self, chat_id):
+        group = isinstance(chat_id, str) or chat_id < 0
+        interval = GROUP_CHAT_INTERVAL if group else PRIVATE_CHAT_INTERVAL
+        now = time.monotonic()
+        slot = max(now, self._chat_slots.get(chat_id, 0.0))
+        self._chat_slots[chat_id] = slot + interval
+        if len(self._chat_slots) > 10000:
+            self._chat_slots = {key: value for key, value in self._chat_slots.items()
+                                if value > now}
+        if slot > now:
+            self._pacing += 1
+            try:
+                await asyncio.sleep(slot - now)
+            finally:
+                self._pacing -= 1
+
+    async def _acquire(self, priority, cost=1):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._counter), cost, future))
+        self._wakeup.set()
+        await future
+
+    # Выдача разрешений из очереди по приоритету с учетом общего лимита
+    async def _run(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # Ждем токенов на первый в очереди запрос; пока ждем, в начало
+            # может встать более приоритетный - разрешение получит он,
+            # недостающие токены уйдут в долг следующим запросам
+            await self._wait_tokens(self._queue[0][2])
+            _, _, cost, future = heapq.heappop(self._queue)
+            if not future.done():
+                self._tokens -= cost
+                future.set_result(None)
+
+    async def _wait_tokens(self, cost):
+        cost = min(cost, self.rate)
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= cost:
+                return
+            await asyncio.sleep((cost - self._tokens) / self.rate)
@@ -0,0 +1,113 @@
+import logging
+import os
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest
+
+from photo_cache import photo_cache
+from rate_limiter import NOTIFICATION
+
+logger = logging.getLogger()
+
+# Объединять объявления с фото в альбомы send_media_group
+SEND_ALBUMS = os.getenv('SEND_ALBUMS') == '1'
+# Максимум фото в одном альбоме Telegram
+ALBUM_SIZE = 10
+
+
+# Самое крупное из превью отправленного фото - его file_id подходит
+# для повторной отправки
+def remember_photo(image_url, message):
+    if message.photo:
+        photo_cache.put(image_url, message.photo[-1].file_id)
+
+
+def format_listing(listing):
+    return (
+        f"<b>{listing['city']}, {listing['district']}</b>\n"
+        f"{listing['type']}, <b>{listing['size']} m2</b>\n"
+        f"Количество комнат: <b>{listing['rooms']}</b>\n"
+        f"Разместил: <b>{listing['reporter']}</b>\n\n"
+        f"<b>{listing['price']} {listing['currency']}</b>\n\n"
+        f"<i>от {listing['published']}</i>\n"
+        f"Источник: <a href='{listing['url']}'>{listing['src']}</a>"
+    )
+
+
+# Отправка объявления пользователю: с фото, если оно есть и Telegram
+# смог его загрузить, иначе текстом. Уведомления идут в очереди
+# ограничителя после ответов пользователям. Уже загруженное в Telegram
+# фото отправляется по file_id. Ошибки сети и RetryAfter пробрасываются:
+# file_id при них остается в кэше, а объявление не уходит текстом
+async def send_listing(bot, chat_id, listing):
+    reply_text = format_listing(listing)
+    image_url = listing['image_url']
+
+    if image_url:
+        file_id = photo_cache.get(image_url)
+        try:
+            message = await bot.send_photo(chat_id=chat_id, photo=file_id or image_url, caption=reply_text,
+                                           parse_mode='HTML', rate_limit_args=NOTIFICATION)
+            remember_photo(image_url, message)
+            return
+        # BadRequest - Telegram отклонил фото: устаревший file_id
+        # или ссылка, которую он не смог загрузить
+        except BadRequest as e:
+            logger.error(f'Ошибка отправки фото: {e}')
+            if file_id:
+                photo_cache.discard(image_url)
+    await bot.send_message(chat_id=chat_id, text=reply_text, parse_mode='HTML',
+                           rate_limit_args=NOTIFICATION)
+
+
+# Отправка альбома из объявлений с фото, у каждого фото своя подпись.
+# Если Telegram не смог загрузить хотя бы одно фото, альбом не отправляется
+# целиком - тогда объявления уходят по одному
+async def send_album(bot, chat_id, listings):
+    file_ids = [photo_cache.get(listing['image_url']) for listing in listings]
+    media = [InputMediaPhoto(media=file_id or listing['image_url'], caption=format_listing(listing),
+                             parse_mode='HTML')
+             for listing, file_id in zip(listings, file_ids)]
+    try:
+        messages = await bot.send_media_group(chat_id=chat_id, media=media,
+                                              rate_limit_args=NOTIFICATION)
+        for listing, message in zip(listings, messages):
+            remember_photo(listing['image_url'], message)
+        return
+    except BadRequest as e:
+        logger.error(f'Ошибка отправки альбома: {e}')
+        # Неизвестно, какой из file_id не подошел: отправка по одному
+        # пойдет по ссылкам и сохранит file_id заново
+        for listing, file_id in zip(listings, file_ids):
+            if file_id:
+                photo_cache.discard(listing['image_url'])
+    for listing in listings:
+        await send_listing(bot, chat_id, listing)
+
+
+# Отправка объявлений пользователю по порядку. С SEND_ALBUMS подряд идущие
+# объявления с фото собираются в альбомы до ALBUM_SIZE штук
+async def send_listings_to(bot, chat_id, listings):
+    if not SEND_ALBUMS:
+        for listing in listings:
+            await send_listing(bot, chat_id, listing)
+        return
+
+    album = []
+    for listing in listings:
+        if listing['image_url']:
+            album.append(listing)
+            if len(album) < ALBUM_SIZE:
+                continue
+        await _flush_album(bot, chat_id, album)
+        album = []
+        if not listing['image_url']:
+            await send_listing(bot, chat_id, listing)
+    await _flush_album(bot, chat_id, album)
+
+
+async def _flush_album(bot, chat_id, album):
+    if len(album) == 1:
+        await send_listing(bot, chat_id, album[0])
+    elif album:
+        await send_album(bot, chat_id, album)
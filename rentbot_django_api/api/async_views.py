@@ -0,0 +1,95 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from rest_framework import status
+
+from .models import Apartment, Task
+from .renderers import ORJSONRenderer
+from .rows import apartment_row, compact
+from .serializers import TaskSerializer
+from .streaming import CONTENT_TYPES, astream_body, fetch_chunk
+from .views import apartment_create_list, list_apartments, parse_list_params
+
+_renderer = ORJSONRenderer()
+
+
+# Запросы к БД выполняются в пуле потоков, а не в одном общем потоке
+# (thread_sensitive=True), иначе при ASGI все опросы встают в одну очередь.
+# Соединения потока закрываются по тем же правилам CONN_MAX_AGE, что и в
+# обычном запросе
+def _run_in_thread(func):
+    def wrapper(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+def _response(data, code=status.HTTP_200_OK):
+    return HttpResponse(_renderer.render(data), status=code,
+                        content_type=_renderer.media_type)
+
+
+_list_apartments = _run_in_thread(list_apartments)
+_fetch_chunk = _run_in_thread(fetch_chunk)
+_parse_list_params = _run_in_thread(parse_list_params)
+
+
+@_run_in_thread
+def _apartment(pk, compact_output):
+    data = apartment_row(Apartment.objects.filter(pk=pk))
+    if data is not None and compact_output:
+        data = compact(data)
+    return data
+
+
+@_run_in_thread
+def _tasks_by_user_id(user_id):
+    return TaskSerializer(Task.objects.filter(user_id=user_id), many=True).data
+
+
+# GET обрабатывается асинхронно, загрузка объявлений (POST) остается
+# в синхронном представлении DRF
+async def apartment_create_list_async(request):
+    if request.method == 'GET':
+        stream = request.GET.get('stream')
+        if stream:
+            if stream not in CONTENT_TYPES:
+                return _response({'error': 'Invalid stream'}, status.HTTP_400_BAD_REQUEST)
+            try:
+                query = await _parse_list_params(request.GET)
+            except ValueError as e:
+                return _response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+            # Синхронный итератор под ASGI Django 4.2 собрал бы весь ответ
+            # в памяти, поэтому порции читаются асинхронным генератором
+            return StreamingHttpResponse(astream_body(query, stream, _fetch_chunk),
+                                         content_type=CONTENT_TYPES[stream])
+
+        data, code = await _list_apartments(request.GET)
+        return _response(data, code)
+    return await sync_to_async(apartment_create_list)(request)
+
+
+# csrf_exempt в Django 4.2 не поддерживает асинхронные представления,
+# как и DRF, загрузка объявлений идет без CSRF-токена
+apartment_create_list_async.csrf_exempt = True
+
+
+async def apartment_detail_async(request, pk):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    data = await _apartment(pk, request.GET.get('compact') == '1')
+    if data is None:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    return _response(data)
+
+
+async def task_filter_by_user_id_async(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user_id = request.GET.get('user_id')
+    if not user_id:
+        return _response({'detail': 'Отсутствует user_id.'}, status.HTTP_400_BAD_REQUEST)
+    return _response(await _tasks_by_user_id(user_id))
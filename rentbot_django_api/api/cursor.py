@@ -0,0 +1,67 @@
+import base64
+from datetime import timedelta
+
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Размер страницы по умолчанию и максимальный при постраничной выдаче
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+# Объявления старше этого окна не выдаются ни по last_sent_date, ни по курсору
+FRESHNESS = timedelta(minutes=30)
+
+
+# Курсор - позиция в выдаче, отсортированной по (insertedAt, id),
+# для клиента это непрозрачная строка
+def encode_cursor(inserted_at, pk):
+    raw = f'{inserted_at.isoformat()}|{pk}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+# Возвращает (insertedAt, id), ValueError при неверном курсоре
+def decode_cursor(value):
+    try:
+        raw = base64.urlsafe_b64decode(value.encode('ascii')).decode('utf-8')
+        inserted_at, pk = raw.split('|')
+        inserted_at = parse_datetime(inserted_at)
+        pk = int(pk)
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if inserted_at is None or inserted_at.tzinfo is None:
+        raise ValueError('Invalid cursor')
+    return inserted_at, pk
+
+
+def parse_limit(value):
+    if value is None:
+        return DEFAULT_LIMIT
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return min(limit, MAX_LIMIT)
+
+
+def freshness_floor():
+    return timezone.now() - FRESHNESS
+
+
+# Позиция курсора не раньше начала окна свежести: бот, простоявший
+# дольше окна, не получает накопившиеся за это время объявления
+def clamp_position(position, floor):
+    return max(position, (floor, 0))
+
+
+# Объявления после курсора, а без курсора - после last_sent_date
+def apartments_after(apartments, position, last_sent_date):
+    if position:
+        # Курсор продолжает выдачу ровно с места остановки,
+        # в том числе среди записей с одинаковым insertedAt.
+        # Условие insertedAt >= позволяет читать индекс по insertedAt
+        # с позиции курсора, а не с самой старой записи
+        inserted_at, pk = position
+        return apartments.filter(
+            models.Q(insertedAt__gte=inserted_at),
+            models.Q(insertedAt__gt=inserted_at)
+            | models.Q(insertedAt=inserted_at, id__gt=pk))
+    return apartments.filter(insertedAt__gt=last_sent_date)
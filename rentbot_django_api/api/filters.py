@@ -0,0 +1,180 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import models
+
+ROOMS_QUANTUM = Decimal('0.1')
+
+# Все фильтры бота задаются здесь: compile_filters приводит их к готовому для
+# запроса виду, apartment_filter_q и apartment_matches одинаково применяют
+# его к БД и к уже загруженному объявлению. Скомпилированные фильтры задачи
+# хранятся в Task.compiled_filters:
+#   city - город, None - ни одно объявление не подходит
+#   reporters, districts, property_types - допустимые значения, [] - любые
+#   sizes - [[min, max], ...] включительные границы площади, None - без границы
+#   rooms - точные значения комнат строками ('2.0'), min_rooms - для 'N+'
+#   min_price, max_price - целые или None
+
+
+# Диапазоны площади из фильтров бота ('<20', '20-40', '>100') в пары
+# включительных границ (min, max), None - граница не задана.
+# Неразборчивые значения пропускаются
+def parse_size_ranges(sizes):
+    ranges = []
+    for size_range in sizes or []:
+        try:
+            if size_range.startswith('<'):
+                ranges.append((None, int(size_range[1:]) - 1))
+            elif size_range.startswith('>'):
+                ranges.append((int(size_range[1:]) + 1, None))
+            else:
+                min_size, max_size = map(int, size_range.split('-'))
+                ranges.append((min_size, max_size))
+        except ValueError:
+            continue
+    return ranges
+
+
+# Количество комнат ('1', '2.5', '4+') в набор точных значений
+# и нижнюю границу для значений вида 'N+'
+def parse_rooms(rooms):
+    values = set()
+    min_rooms = None
+    for value in rooms or []:
+        try:
+            if value.endswith('+'):
+                bound = Decimal(value[:-1])
+                min_rooms = bound if min_rooms is None else min(min_rooms, bound)
+            else:
+                values.add(Decimal(value))
+        except InvalidOperation:
+            continue
+    return values, min_rooms
+
+
+def _rooms_str(value):
+    return str(value.quantize(ROOMS_QUANTUM))
+
+
+def _price(value):
+    # 0 и пустое значение, как и раньше, означают отсутствие ограничения
+    if not value:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid price')
+
+
+# Фильтры в исходном виде (как их отправляет бот) в скомпилированный.
+# ValueError при нечисловой цене
+def compile_filters(filters):
+    values, min_rooms = parse_rooms(filters.get('rooms'))
+    return {
+        'city': filters.get('city') or None,
+        'reporters': sorted(set(filters.get('reporters') or [])),
+        'districts': sorted(set(filters.get('districts') or [])),
+        'property_types': sorted(set(filters.get('property_types') or [])),
+        'sizes': sorted(set(parse_size_ranges(filters.get('sizes'))),
+                        key=lambda bounds: (bounds[0] or 0, bounds[1] or 0)),
+        'rooms': sorted(_rooms_str(value) for value in values),
+        'min_rooms': _rooms_str(min_rooms) if min_rooms is not None else None,
+        'min_price': _price(filters.get('min_price')),
+        'max_price': _price(filters.get('max_price')),
+    }
+
+
+# Фильтры задачи бота в исходном виде
+def task_raw_filters(task):
+    return {
+        'city': task.city,
+        'reporters': task.reporters,
+        'sizes': task.sizes,
+        'min_price': task.min_price,
+        'max_price': task.max_price,
+        'districts': task.districts,
+        'property_types': task.property_types,
+        'rooms': task.rooms,
+    }
+
+
+# Скомпилированные фильтры задачи: сохраненные при записи задачи
+def task_filters(task):
+    if task.compiled_filters is None:
+        return compile_filters(task_raw_filters(task))
+    return task.compiled_filters
+
+
+def size_ranges_q(ranges):
+    query = models.Q()
+    for min_size, max_size in ranges:
+        bounds = {}
+        if min_size is not None:
+            bounds['size__gte'] = min_size
+        if max_size is not None:
+            bounds['size__lte'] = max_size
+        query |= models.Q(**bounds)
+    return query
+
+
+def rooms_q(rooms, min_rooms):
+    query = models.Q()
+    if rooms:
+        query |= models.Q(rooms__in=[Decimal(value) for value in rooms])
+    if min_rooms is not None:
+        query |= models.Q(rooms__gte=Decimal(min_rooms))
+    return query
+
+
+# Условие выборки объявлений по скомпилированным фильтрам
+def apartment_filter_q(compiled):
+    query = models.Q(city__iexact=compiled['city'])
+    if compiled['reporters']:
+        query &= models.Q(reporter__in=compiled['reporters'])
+    if compiled['sizes']:
+        query &= size_ranges_q(compiled['sizes'])
+    if compiled['min_price'] is not None:
+        query &= models.Q(price__gte=compiled['min_price'])
+    if compiled['max_price'] is not None:
+        query &= models.Q(price__lte=compiled['max_price'])
+    if compiled['districts']:
+        query &= models.Q(district__in=compiled['districts'])
+    if compiled['property_types']:
+        query &= models.Q(type__in=compiled['property_types'])
+    if compiled['rooms'] or compiled['min_rooms'] is not None:
+        query &= rooms_q(compiled['rooms'], compiled['min_rooms'])
+    return query
+
+
+def size_matches(bounds, size):
+    min_size, max_size = bounds
+    return (min_size is None or size >= min_size) and (max_size is None or size <= max_size)
+
+
+def rooms_match(rooms, min_rooms, value):
+    value = Decimal(value)
+    return (_rooms_str(value) in rooms
+            or (min_rooms is not None and value >= Decimal(min_rooms)))
+
+
+# Те же фильтры, проверяемые для уже загруженного объявления без запроса к БД
+def apartment_matches(compiled, apartment):
+    city = compiled['city']
+    if not city or city.casefold() != apartment.city.casefold():
+        return False
+    if compiled['reporters'] and apartment.reporter not in compiled['reporters']:
+        return False
+    if compiled['min_price'] is not None and apartment.price < compiled['min_price']:
+        return False
+    if compiled['max_price'] is not None and apartment.price > compiled['max_price']:
+        return False
+    if compiled['districts'] and apartment.district not in compiled['districts']:
+        return False
+    if compiled['property_types'] and apartment.type not in compiled['property_types']:
+        return False
+    if compiled['sizes'] and not any(size_matches(bounds, apartment.size)
+                                     for bounds in compiled['sizes']):
+        return False
+    if ((compiled['rooms'] or compiled['min_rooms'] is not None)
+            and not rooms_match(compiled['rooms'], compiled['min_rooms'], apartment.rooms)):
+        return False
+    return True
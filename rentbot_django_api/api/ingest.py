@@ -0,0 +1,93 @@
+import logging
+
+from django.db import connection
+from django.utils import timezone
+
+from . import response_cache
+from .models import Apartment
+from .percolator import enqueue_deliveries, prune_deliveries
+
+logger = logging.getLogger(__name__)
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+
+# Поля, которые меняются у повторно найденного объявления
+UPDATE_FIELDS = ('price', 'currency', 'rooms', 'size', 'reporter', 'image_url', 'url')
+
+INSERT_FIELDS = ('city', 'district', 'price', 'currency', 'type', 'rooms', 'size',
+                 'reporter', 'published', 'internalId', 'src', 'image_url', 'url',
+                 'insertedAt')
+
+BATCH_SIZE = 500
+
+
+# Загрузка объявлений одним INSERT ... ON CONFLICT (src, internalId) DO UPDATE
+# на пачку. Изменившиеся поля UPDATE_FIELDS обновляются на месте, строки без
+# изменений не трогаются. rows - проверенные ApartmentSerializer данные.
+# Возвращает список (статус, id) в порядке rows; для UNCHANGED id равен None
+def upsert_apartments(rows):
+    results = [None] * len(rows)
+    # Повторы внутри одной пачки postgres не позволяет обновлять дважды
+    positions = {}
+    for index, row in enumerate(rows):
+        positions.setdefault((row['src'], row['internalId']), []).append(index)
+
+    unique = [rows[indexes[0]] for indexes in positions.values()]
+    for start in range(0, len(unique), BATCH_SIZE):
+        batch = unique[start:start + BATCH_SIZE]
+        for key, (result, pk) in _upsert_batch(batch).items():
+            first, *repeats = positions[key]
+            results[first] = (result, pk)
+            for index in repeats:
+                results[index] = (UNCHANGED, pk)
+
+    results = [result or (UNCHANGED, None) for result in results]
+    if any(result != UNCHANGED for result, _ in results):
+        response_cache.bump_version()
+
+    # Новые объявления сразу раскладываются по очередям доставки задач
+    # (если очередь включена), устаревшие записи удаляются; ошибка здесь
+    # не должна отменять уже сохраненные объявления
+    try:
+        enqueue_deliveries([pk for result, pk in results if result == CREATED])
+        prune_deliveries()
+    except Exception:
+        logger.exception('Не удалось записать очередь доставки')
+    return results
+
+
+def _upsert_batch(rows):
+    quote = connection.ops.quote_name
+    table = quote(Apartment._meta.db_table)
+    fields = [Apartment._meta.get_field(name) for name in INSERT_FIELDS]
+    now = timezone.now()
+
+    params = []
+    for row in rows:
+        values = {**row, 'insertedAt': now}
+        params.extend(field.get_db_prep_save(values[field.name], connection)
+                      for field in fields)
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+    columns = ', '.join(quote(field.column) for field in fields)
+    updates = ', '.join(f'{quote(name)} = excluded.{quote(name)}' for name in UPDATE_FIELDS)
+    changed = ' OR '.join(f'{table}.{quote(name)} <> excluded.{quote(name)}'
+                          for name in UPDATE_FIELDS)
+    inserted_at = Apartment._meta.get_field('insertedAt').get_db_prep_save(now, connection)
+
+    sql = (
+        f'INSERT INTO {table} ({columns}) VALUES {", ".join([placeholders] * len(rows))} '
+        f'ON CONFLICT ({quote("src")}, {quote("internalId")}) DO UPDATE SET {updates} '
+        f'WHERE {changed} '
+        f'RETURNING {quote("id")}, {quote("src")}, {quote("internalId")}, '
+        f'{quote("insertedAt")} = %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [inserted_at])
+        returned = cursor.fetchall()
+
+    # Вставленные строки получили insertedAt = now, обновленные сохранили прежний
+    return {(src, internal_id): (CREATED if created else UPDATED, pk)
+            for pk, src, internal_id, created in returned}
@@ -0,0 +1,16 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+# Замеры выполняются в отдельной тестовой БД (для sqlite - в памяти,
+# для postgres - test_<имя БД>): тестовые объявления не попадают в рабочую
+# таблицу и не уходят пользователям, индексы рабочей БД не трогаются
+@contextmanager
+def bench_database():
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
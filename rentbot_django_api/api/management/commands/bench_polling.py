@@ -0,0 +1,126 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from api.cursor import encode_cursor
+from api.models import Apartment, Task
+from api.views import list_apartments
+
+from ._bench import bench_database
+
+BENCH_SRC = 'bench'
+CITIES = ['Белград', 'Нови Сад']
+ROOMS = [[], ['1', '1.5'], ['2'], ['3', '4+']]
+PAGE_LIMIT = 100
+
+# Кэш выдачи отключен: замеряется запрос к БД, а не попадание в кэш
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = ('Заполняет тестовую БД объявлениями и задачами и замеряет '
+            'задержку опроса, которым бот получает новые объявления')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000,
+                            help='количество тестовых объявлений')
+        parser.add_argument('--days', type=int, default=30,
+                            help='за сколько дней распределить объявления')
+        parser.add_argument('--runs', type=int, default=500,
+                            help='количество выполнений запроса')
+        parser.add_argument('--compare', action='store_true',
+                            help='замерить также без индексов модели Apartment')
+
+    def handle(self, *args, **options):
+        with bench_database(), override_settings(CACHES=NO_CACHE):
+            self.seed(options['count'], options['days'])
+            tasks = self.seed_tasks()
+            if options['compare']:
+                with connection.schema_editor() as schema_editor:
+                    for index in Apartment._meta.indexes:
+                        schema_editor.remove_index(Apartment, index)
+                try:
+                    self.report('без индексов', tasks, options['runs'])
+                finally:
+                    with connection.schema_editor() as schema_editor:
+                        for index in Apartment._meta.indexes:
+                            schema_editor.add_index(Apartment, index)
+            self.report('с индексами', tasks, options['runs'])
+
+    def seed(self, count, days):
+        self.stdout.write(f'Создание {count} объявлений...')
+        now = timezone.now()
+        apartments = Apartment.objects.bulk_create(
+            [Apartment(city=random.choice(CITIES), district='Bench',
+                       price=random.randint(200, 2000), currency='€',
+                       type='Квартира', rooms=random.choice([1, 1.5, 2, 3]),
+                       size=random.randint(20, 120), reporter='Агенство',
+                       published='', internalId=f'bench-{now.timestamp()}-{i}',
+                       src=BENCH_SRC, image_url='https://example.com/image.jpg',
+                       url=f'https://example.com/{i}')
+             for i in range(count)],
+            batch_size=1000
+        )
+        # insertedAt выставляется при вставке, распределяем его по периоду отдельно
+        step = timedelta(days=days) / count
+        for i, apartment in enumerate(apartments):
+            apartment.insertedAt = now - step * (count - i)
+        Apartment.objects.bulk_update(apartments, ['insertedAt'], batch_size=1000)
+
+    @staticmethod
+    def seed_tasks():
+        tasks = []
+        for user_id, (city, rooms) in enumerate(
+                [(city, rooms) for city in CITIES for rooms in ROOMS], start=1):
+            tasks.append(Task.objects.create(user_id=user_id, city=city, rooms=rooms,
+                                             isReady=True))
+        return tasks
+
+    # Параметры опроса бота: задача и курсор не старше 30 минут
+    @staticmethod
+    def polling_params(task):
+        position = timezone.now() - timedelta(minutes=random.randint(1, 30))
+        params = QueryDict(mutable=True)
+        params.update({'task': task.id, 'limit': PAGE_LIMIT,
+                       'cursor': encode_cursor(position, 0)})
+        return params
+
+    # План запроса, который list_apartments на самом деле выполнила
+    # для опроса: SQL перехватывается, а не собирается здесь заново
+    def explain_polling(self, task):
+        with CaptureQueriesContext(connection) as queries:
+            list_apartments(self.polling_params(task))
+        table = Apartment._meta.db_table
+        sql = [query['sql'] for query in queries.captured_queries
+               if f'FROM "{table}"' in query['sql']][-1]
+        self.stdout.write(sql)
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            for row in cursor.fetchall():
+                self.stdout.write(' '.join(str(column) for column in row))
+
+    def report(self, title, tasks, runs):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Запрос опроса ({title}):'))
+        self.explain_polling(tasks[0])
+
+        timings = []
+        for _ in range(runs):
+            params = self.polling_params(random.choice(tasks))
+            start = time.perf_counter()
+            data, code = list_apartments(params)
+            timings.append((time.perf_counter() - start) * 1000)
+            if code != 200:
+                self.stderr.write(f'Ошибка опроса: {code} {data}')
+                return
+
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(f'p50: {statistics.median(timings):.2f} мс, p99: {p99:.2f} мс')
@@ -0,0 +1,79 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Apartment
+from api.renderers import ORJSONRenderer
+from api.rows import apartment_rows, compact
+from api.serializers import ApartmentSerializer
+
+from ._bench import bench_database
+from .bench_polling import BENCH_SRC, CITIES
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость выдачи объявлений через ApartmentSerializer '
+            'и через values() с orjson (строк в секунду)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000,
+                            help='количество объявлений в одном ответе')
+        parser.add_argument('--runs', type=int, default=50,
+                            help='количество повторов каждого способа')
+
+    def handle(self, *args, **options):
+        with bench_database():
+            self.seed(options['count'])
+            queryset = Apartment.objects.filter(src=BENCH_SRC).order_by('insertedAt', 'id')
+            serializer_json = self.serializer(queryset)
+            fast_json = self.fast(queryset)
+            if json.loads(serializer_json) != json.loads(fast_json):
+                self.stderr.write('Ответы ApartmentSerializer и values() отличаются')
+
+            count, runs = options['count'], options['runs']
+            self.report('ApartmentSerializer + JSONRenderer', self.serializer, queryset, count, runs)
+            self.report('values() + orjson', self.fast, queryset, count, runs)
+            self.report('values() + orjson, compact=1', self.compact, queryset, count, runs)
+
+    def seed(self, count):
+        self.stdout.write(f'Создание {count} объявлений...')
+        now = timezone.now()
+        Apartment.objects.bulk_create(
+            [Apartment(city=random.choice(CITIES), district='Bench',
+                       price=random.randint(200, 2000), currency='€',
+                       type='Квартира', rooms=random.choice([1, 1.5, 2, 3]),
+                       size=random.randint(20, 120), reporter='Агенство',
+                       published='01.01.2024 10:00', internalId=f'bench-{now.timestamp()}-{i}',
+                       src=BENCH_SRC, image_url='https://example.com/image.jpg',
+                       url=f'https://example.com/{i}')
+             for i in range(count)],
+            batch_size=1000
+        )
+
+    @staticmethod
+    def serializer(queryset):
+        return JSONRenderer().render(ApartmentSerializer(queryset, many=True).data)
+
+    @staticmethod
+    def fast(queryset):
+        return ORJSONRenderer().render([data for _, _, data in apartment_rows(queryset)])
+
+    @staticmethod
+    def compact(queryset):
+        return ORJSONRenderer().render([compact(data) for _, _, data in apartment_rows(queryset)])
+
+    def report(self, title, render, queryset, count, runs):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            body = render(queryset)
+            timings.append(time.perf_counter() - start)
+
+        median = statistics.median(timings)
+        self.stdout.write(f'{title}: {count / median:,.0f} строк/с, '
+                          f'{median * 1000:.2f} мс на ответ, {len(body) / 1024:.1f} КБ')
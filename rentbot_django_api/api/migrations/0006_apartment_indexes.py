@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-18 18:54
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_alter_apartment_published'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='apartment',
+            index=models.Index(django.db.models.functions.text.Upper('city'), models.F('insertedAt'), name='apartment_city_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apartment',
+            index=models.Index(fields=['insertedAt'], name='apartment_inserted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apartment',
+            index=models.Index(fields=['src', 'internalId'], name='apartment_src_internal_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_apartment_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='apartment',
+            name='apartment_src_internal_idx',
+        ),
+        migrations.AlterField(
+            model_name='apartment',
+            name='internalId',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='apartment',
+            constraint=models.UniqueConstraint(fields=('src', 'internalId'), name='apartment_src_internal_uniq'),
+        ),
+    ]
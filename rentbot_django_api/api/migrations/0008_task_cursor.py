@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_apartment_src_internal_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='cursor',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.13 on 2026-10-18 19:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_task_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Delivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('apartment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='api.apartment')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='api.task')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='delivery',
+            constraint=models.UniqueConstraint(fields=('task', 'apartment'), name='delivery_task_apartment_uniq'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 4.2.13 on 2026-10-18 19:07
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+# Копия api.filters на момент миграции: последующие изменения модуля
+# не должны менять то, что делает эта миграция
+ROOMS_QUANTUM = Decimal('0.1')
+
+
+def parse_size_ranges(sizes):
+    ranges = []
+    for size_range in sizes or []:
+        try:
+            if size_range.startswith('<'):
+                ranges.append((None, int(size_range[1:]) - 1))
+            elif size_range.startswith('>'):
+                ranges.append((int(size_range[1:]) + 1, None))
+            else:
+                min_size, max_size = map(int, size_range.split('-'))
+                ranges.append((min_size, max_size))
+        except ValueError:
+            continue
+    return ranges
+
+
+def parse_rooms(rooms):
+    values = set()
+    min_rooms = None
+    for value in rooms or []:
+        try:
+            if value.endswith('+'):
+                bound = Decimal(value[:-1])
+                min_rooms = bound if min_rooms is None else min(min_rooms, bound)
+            else:
+                values.add(Decimal(value))
+        except InvalidOperation:
+            continue
+    return values, min_rooms
+
+
+def rooms_str(value):
+    return str(value.quantize(ROOMS_QUANTUM))
+
+
+def price(value):
+    if not value:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid price')
+
+
+def compile_filters(task):
+    values, min_rooms = parse_rooms(task.rooms)
+    return {
+        'city': task.city or None,
+        'reporters': sorted(set(task.reporters or [])),
+        'districts': sorted(set(task.districts or [])),
+        'property_types': sorted(set(task.property_types or [])),
+        'sizes': sorted(set(parse_size_ranges(task.sizes)),
+                        key=lambda bounds: (bounds[0] or 0, bounds[1] or 0)),
+        'rooms': sorted(rooms_str(value) for value in values),
+        'min_rooms': rooms_str(min_rooms) if min_rooms is not None else None,
+        'min_price': price(task.min_price),
+        'max_price': price(task.max_price),
+    }
+
+
+def compile_task_filters(apps, schema_editor):
+    Task = apps.get_model('api', 'Task')
+    tasks = list(Task.objects.all())
+    for task in tasks:
+        task.compiled_filters = compile_filters(task)
+    Task.objects.bulk_update(tasks, ['compiled_filters'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='compiled_filters',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(compile_task_filters, migrations.RunPython.noop),
+    ]
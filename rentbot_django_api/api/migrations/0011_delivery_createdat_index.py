@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_task_compiled_filters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='delivery',
+            name='createdAt',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
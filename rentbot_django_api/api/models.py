@@ -1,7 +1,10 @@
 # models.py
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils import timezone
 
+from .filters import compile_filters, task_raw_filters
+
 
 # Объявление
 class Apartment(models.Model):
@@ -14,12 +17,26 @@ class Apartment(models.Model):
     size = models.IntegerField()
     reporter = models.CharField(max_length=100)
     published = models.CharField(max_length=100)
-    internalId = models.CharField(max_length=100, unique=True)
+    internalId = models.CharField(max_length=100)
     src = models.CharField(max_length=100)
     image_url = models.URLField(max_length=200)
     url = models.URLField(max_length=200)
     insertedAt = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Опрос ботом: city__iexact (UPPER(city) в postgres) + insertedAt__gt,
+            # сортировка по insertedAt
+            models.Index(Upper('city'), 'insertedAt', name='apartment_city_upper_idx'),
+            # Окно свежести по insertedAt без учета города
+            models.Index(fields=['insertedAt'], name='apartment_inserted_idx'),
+        ]
+        constraints = [
+            # Ключ для загрузки через INSERT ... ON CONFLICT
+            models.UniqueConstraint(fields=['src', 'internalId'],
+                                    name='apartment_src_internal_uniq'),
+        ]
+
     def __str__(self):
         return f'{self.city} - {self.district} - {self.price} {self.currency} - {self.type} - {self.rooms} - {self.size}'
 
@@ -31,6 +48,8 @@ class Task(models.Model):
     interval = models.IntegerField(default=600)  # 10 минут по дефолту
     # Последняя последнего сообщения
     last_sent_date = models.DateTimeField(default=timezone.now)
+    # Позиция в выдаче объявлений, с которой бот продолжит отправку
+    cursor = models.CharField(max_length=200, null=True, blank=True)
     reporters = models.JSONField(default=list, null=True, blank=True)
     sizes = models.JSONField(default=list, null=True, blank=True)
     min_price = models.IntegerField(null=True, blank=True)
@@ -39,6 +58,34 @@ class Task(models.Model):
     property_types = models.JSONField(default=list, null=True, blank=True)
     rooms = models.JSONField(default=list, null=True, blank=True)
     isReady = models.BooleanField(default=False)
+    # Фильтры в готовом для запроса виде (см. filters.compile_filters),
+    # пересчитываются при каждом сохранении задачи
+    compiled_filters = models.JSONField(null=True, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.compiled_filters = compile_filters(task_raw_filters(self))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'compiled_filters'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'Task(chat_id={self.user_id}, city={self.city}, interval={self.interval}, last_sent_date={self.last_sent_date}, isReady={self.isReady})'
+
+
+# Очередь доставки: объявление, подходящее под фильтры задачи,
+# ждет отправки ботом и удаляется после подтверждения
+class Delivery(models.Model):
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='deliveries')
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='deliveries')
+    # Индекс для удаления устаревших записей (percolator.prune_deliveries)
+    createdAt = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'apartment'],
+                                    name='delivery_task_apartment_uniq'),
+        ]
+
+    def __str__(self):
+        return f'Delivery(task={self.task_id}, apartment={self.apartment_id})'
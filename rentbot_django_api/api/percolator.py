@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import product
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .filters import size_matches, task_filters
+from .models import Apartment, Delivery, Task
+from .response_cache import incr_shared, shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Ключ уровня индекса для задач без ограничения по этому полю
+ANY = None
+
+# Версия задач в общем кэше: увеличивается при каждом изменении задачи
+# в любом процессе API, и индексы всех процессов перестраиваются
+TASKS_VERSION_KEY = 'tasks:version'
+# На случай вытеснения версии из кэша индекс перестраивается
+# и не реже раза в REBUILD_INTERVAL секунд
+REBUILD_INTERVAL = int(os.getenv('PERCOLATOR_REBUILD_INTERVAL', 300))
+
+# Очередь доставки заполняется только для клиента, который ее забирает
+# (GET /deliveries/ + ack); бот по умолчанию опрашивает /apartments/matches/
+OUTBOX_ENABLED = os.getenv('DELIVERY_OUTBOX') == '1'
+# Неподтвержденные записи старше этого срока удаляются
+RETENTION = timedelta(hours=int(os.getenv('DELIVERY_RETENTION_HOURS', 24)))
+
+
+def _keys(values):
+    return set(values) if values else {ANY}
+
+
+# Обратный индекс готовых задач: город -> район -> диапазон площади ->
+# комнаты -> тип -> автор -> {task_id: (min_price, max_price)}.
+# Задача с несколькими значениями фильтра лежит в каждой ветке, поэтому
+# для объявления проверяются только ветки с его значениями и ветки ANY
+class TaskIndex:
+    def __init__(self) -> None:
+        self._root = {}
+        self._lock = threading.Lock()
+        self.built_at = None
+        self.version = None
+
+    def rebuild(self, version):
+        tasks = list(Task.objects.filter(isReady=True).exclude(city__isnull=True))
+        root = {}
+        for task in tasks:
+            self._add(root, task)
+        with self._lock:
+            self._root = root
+            self.built_at = time.monotonic()
+            self.version = version
+        logger.info(f'Индекс задач перестроен: {len(tasks)}')
+
+    def stale(self, version):
+        return (self.built_at is None or version != self.version
+                or time.monotonic() - self.built_at > REBUILD_INTERVAL)
+
+    # Перед сопоставлением пачки объявлений: индекс перестраивается,
+    # если задачи изменились в любом процессе API
+    def refresh(self):
+        # Версия читается до загрузки задач: изменение во время
+        # перестроения вызовет еще одно перестроение, а не потеряется
+        version = tasks_version()
+        if self.stale(version):
+            self.rebuild(version)
+
+    def match(self, apartment):
+
+        rooms = Decimal(apartment.rooms)
+        found = set()
+        with self._lock:
+            for districts in self._children(self._root, apartment.city.casefold()):
+                for sizes in self._children(districts, apartment.district):
+                    for size_range, rooms_level in sizes.items():
+                        if not self._in_size_range(size_range, apartment.size):
+                            continue
+                        for rooms_key, types in rooms_level.items():
+                            if not self._in_rooms(rooms_key, rooms):
+                                continue
+                            for reporters in self._children(types, apartment.type):
+                                for leaf in self._children(reporters, apartment.reporter):
+                                    found.update(
+                                        task_id for task_id, (min_price, max_price) in leaf.items()
+                                        if (min_price is None or apartment.price >= min_price)
+                                        and (max_price is None or apartment.price <= max_price))
+        return found
+
+    @staticmethod
+    def _children(node, value):
+        for key in (value, ANY):
+            child = node.get(key)
+            if child is not None:
+                yield child
+
+    @staticmethod
+    def _in_size_range(size_range, size):
+        return size_range is ANY or size_matches(size_range, size)
+
+    @staticmethod
+    def _in_rooms(rooms_key, rooms):
+        if rooms_key is ANY:
+            return True
+        exact, value = rooms_key
+        return rooms == value if exact else rooms >= value
+
+    @staticmethod
+    def _add(root, task):
+        filters = task_filters(task)
+        rooms_keys = {(True, Decimal(value)) for value in filters['rooms']}
+        if filters['min_rooms'] is not None:
+            rooms_keys.add((False, Decimal(filters['min_rooms'])))
+
+        paths = list(product(
+            [filters['city'].casefold()],
+            _keys(filters['districts']),
+            {tuple(bounds) for bounds in filters['sizes']} or {ANY},
+            rooms_keys or {ANY},
+            _keys(filters['property_types']),
+            _keys(filters['reporters']),
+        ))
+        prices = (filters['min_price'], filters['max_price'])
+        for path in paths:
+            node = root
+            for key in path:
+                node = node.setdefault(key, {})
+            node[task.id] = prices
+
+
+task_index = TaskIndex()
+
+
+def tasks_version():
+    return shared_cache().get(TASKS_VERSION_KEY, 0)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def _task_changed(sender, instance, **kwargs):
+    incr_shared(TASKS_VERSION_KEY)
+
+
+# Сопоставление объявлений с готовыми задачами по индексу:
+# {id объявления: {id задачи, ...}}
+def match_apartments(apartments):
+    if not apartments:
+        return {}
+    task_index.refresh()
+    return {apartment.id: task_index.match(apartment) for apartment in apartments}
+
+
+# Записи в очередь доставки для новых объявлений: пары (задача, объявление)
+# находятся по индексу задач сразу при загрузке
+def enqueue_deliveries(apartment_ids):
+    if not OUTBOX_ENABLED or not apartment_ids:
+        return 0
+    apartments = list(Apartment.objects.filter(id__in=apartment_ids))
+    found = match_apartments(apartments)
+    matches = [(task_id, apartment) for apartment in apartments
+               for task_id in found[apartment.id]]
+    # Задача могла быть удалена или снята с готовности в другом процессе
+    ready = set(Task.objects.filter(id__in={task_id for task_id, _ in matches},
+                                    isReady=True).values_list('id', flat=True))
+    deliveries = [Delivery(task_id=task_id, apartment=apartment)
+                  for task_id, apartment in matches if task_id in ready]
+    Delivery.objects.bulk_create(deliveries, ignore_conflicts=True)
+    return len(deliveries)
+
+
+# Удаление записей, которые так и не были подтверждены за RETENTION
+def prune_deliveries():
+    if not OUTBOX_ENABLED:
+        return 0
+    deleted, _ = Delivery.objects.filter(createdAt__lt=timezone.now() - RETENTION).delete()
+    return deleted
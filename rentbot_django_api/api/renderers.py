@@ -0,0 +1,20 @@
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# JSON через orjson. Типы, которых orjson не знает (Decimal, даты, ленивые
+# строки), кодируются так же, как в стандартном JSONRenderer DRF
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def __init__(self) -> None:
+        self._encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=self._encoder.default, option=self.options)
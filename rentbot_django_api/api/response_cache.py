@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache, caches
+from django.utils import timezone
+
+# Ширина временного окна в секундах: запросы с last_sent_date (или курсором)
+# из одного окна делят одну запись кэша
+BUCKET_SECONDS = int(os.getenv('API_CACHE_BUCKET', 60))
+TTL = int(os.getenv('API_CACHE_TTL', 120))
+
+# Старше этого окна выдача не кэшируется: API и так отдает не больше
+# 30 минут объявлений, а для старого курсора кэш не окупится
+MAX_AGE = timedelta(minutes=30)
+
+VERSION_KEY = 'apartments:version'
+HITS_KEY = 'apartments:hits'
+MISSES_KEY = 'apartments:misses'
+
+
+# Кэш, общий для всех процессов API: версия выдачи и счетчики
+def shared_cache():
+    return caches['shared']
+
+
+# Счетчик в общем кэше, значение после увеличения
+def incr_shared(key):
+    shared = shared_cache()
+    # add не перезаписывает существующий счетчик
+    shared.add(key, 0, timeout=None)
+    try:
+        return shared.incr(key)
+    except ValueError:
+        # Счетчик вытеснен из кэша между add и incr
+        shared.set(key, 1, timeout=None)
+        return 1
+
+
+def version():
+    return shared_cache().get(VERSION_KEY, 0)
+
+
+# Вызывается при каждой загрузке новых или измененных объявлений:
+# записи с прежней версией в ключе больше не читаются и истекают по TTL
+def bump_version():
+    incr_shared(VERSION_KEY)
+
+
+def cacheable(since):
+    return since >= timezone.now() - MAX_AGE - timedelta(seconds=BUCKET_SECONDS)
+
+
+def bucket_start(since):
+    timestamp = int(since.timestamp()) // BUCKET_SECONDS * BUCKET_SECONDS
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def _tuple(item):
+    return tuple(item) if isinstance(item, list) else item
+
+
+# Фильтры в каноническом виде: порядок и повторы значений не важны.
+# Диапазоны площади из БД (JSON) приходят списками, из compile_filters -
+# кортежами; перед сравнением они приводятся к кортежам.
+# Город остается как есть: city__iexact в sqlite не учитывает регистр
+# только для латиницы, и 'Белград' и 'белград' выбирают разные строки
+def normalize(filters):
+    normalized = {}
+    for name, value in filters.items():
+        if isinstance(value, (list, tuple)):
+            value = sorted(set(str(_tuple(item)) for item in value))
+        if value:
+            normalized[name] = value
+    return normalized
+
+
+def make_key(filters, start):
+    digest = hashlib.sha1(json.dumps(normalize(filters), sort_keys=True,
+                                     ensure_ascii=False).encode('utf-8')).hexdigest()
+    return f'apartments:{version()}:{digest}:{int(start.timestamp())}'
+
+
+# Строки выдачи (insertedAt, id, данные) для фильтров начиная с окна, в которое
+# попадает since. load(start) загружает строки с insertedAt >= start при промахе.
+# Вызывающий сам отбрасывает строки до since
+def get_rows(filters, since, load):
+    start = bucket_start(since)
+    key = make_key(filters, start)
+    rows = cache.get(key)
+    if rows is not None:
+        incr_shared(HITS_KEY)
+        return rows
+
+    incr_shared(MISSES_KEY)
+    rows = load(start)
+    cache.set(key, rows, timeout=TTL)
+    return rows
+
+
+def stats():
+    shared = shared_cache()
+    hits = shared.get(HITS_KEY, 0)
+    misses = shared.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 3) if total else None,
+        'version': version(),
+    }
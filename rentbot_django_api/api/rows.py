@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+from django.utils import timezone
+
+# Поля в порядке ApartmentSerializer
+FIELDS = ('id', 'city', 'district', 'price', 'currency', 'type', 'rooms', 'size',
+          'reporter', 'published', 'internalId', 'src', 'image_url', 'url',
+          'insertedAt')
+
+# Короткие ключи компактного ответа (?compact=1). internalId и insertedAt
+# боту не нужны: позицию в выдаче передает курсор
+COMPACT_KEYS = {
+    'id': 'i', 'city': 'c', 'district': 'd', 'price': 'p', 'currency': 'cu',
+    'type': 't', 'rooms': 'r', 'size': 's', 'reporter': 'rp', 'published': 'pb',
+    'src': 'sr', 'image_url': 'im', 'url': 'u',
+}
+
+ROOMS_QUANTUM = Decimal('0.1')
+
+
+# Даты и комнаты в том же виде, что отдает DRF: время в текущем часовом
+# поясе (UTC как 'Z'), комнаты строкой с одним знаком после запятой
+def format_datetime(value):
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def format_rooms(value):
+    return '{:f}'.format(value.quantize(ROOMS_QUANTUM))
+
+
+def _row(values):
+    row = dict(zip(FIELDS, values))
+    inserted_at = row['insertedAt']
+    row['rooms'] = format_rooms(row['rooms'])
+    row['insertedAt'] = format_datetime(inserted_at)
+    return inserted_at, row['id'], row
+
+
+# Строки выдачи (insertedAt, id, данные) без создания моделей и сериализатора:
+# кортежи из БД сразу превращаются в словари ответа
+def apartment_rows(queryset):
+    return [_row(values) for values in queryset.values_list(*FIELDS)]
+
+
+def apartment_row(queryset):
+    values = queryset.values_list(*FIELDS).first()
+    return _row(values)[2] if values is not None else None
+
+
+def compact(data):
+    return {short: data[name] for name, short in COMPACT_KEYS.items()}
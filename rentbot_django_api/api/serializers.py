@@ -8,6 +8,9 @@ class ApartmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Apartment
         fields = '__all__'
+        # Уникальность (src, internalId) обеспечивает ограничение в БД,
+        # повторные объявления обновляются при загрузке, а не отклоняются
+        validators = []
 
     def to_internal_value(self, data):
         # касты
@@ -44,13 +47,6 @@ class ApartmentSerializer(serializers.ModelSerializer):
 
         return super().to_internal_value(data)
 
-    def validate(self, data):
-        if Apartment.objects.filter(internalId=data['internalId'],
-                                    src=data['src']).exists():
-            raise serializers.ValidationError(
-                "Объявление с таким ID уже создано.")
-        return data
-
     def validate_district(self, value):
         if value.startswith("Opština "):
             return value.replace("Opština ", "")
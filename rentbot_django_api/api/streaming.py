@@ -0,0 +1,85 @@
+import logging
+import os
+
+import orjson
+
+from .cursor import apartments_after
+from .filters import apartment_filter_q
+from .models import Apartment
+from .rows import apartment_rows, compact
+
+logger = logging.getLogger(__name__)
+
+# Строк в одном запросе к БД: память процесса ограничена одной порцией,
+# сколько бы объявлений ни подошло под фильтры
+CHUNK_SIZE = int(os.getenv('API_STREAM_CHUNK_SIZE', 500))
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+# Следующая порция объявлений после позиции (insertedAt, id).
+# Порции выбираются по ключу, а не курсором БД, поэтому каждую
+# можно выполнить в любом потоке и на любом соединении
+def fetch_chunk(query, position):
+    apartments = Apartment.objects.filter(
+        apartment_filter_q(query['filters'])).order_by('insertedAt', 'id')
+    if position is None:
+        position = query['position']
+    apartments = apartments_after(apartments, position, query['last_sent_date'])
+    return apartment_rows(apartments[:CHUNK_SIZE])
+
+
+def encode_chunk(rows, stream, first, compact_output):
+    items = [orjson.dumps(compact(data) if compact_output else data) for _, _, data in rows]
+    if stream == 'ndjson':
+        return b''.join(item + b'\n' for item in items)
+    body = b','.join(items)
+    return body if first or not body else b',' + body
+
+
+# Тело ответа по частям: открывающая скобка массива уходит сразу,
+# затем порции объявлений по мере чтения из БД
+def stream_body(query, stream):
+    if stream == 'json':
+        yield b'['
+    position = None
+    first = True
+    try:
+        while True:
+            rows = fetch_chunk(query, position)
+            if rows:
+                yield encode_chunk(rows, stream, first, query['compact'])
+                first = False
+                position = rows[-1][:2]
+            if len(rows) < CHUNK_SIZE:
+                break
+    except Exception:
+        # Статус уже отправлен, клиент увидит оборванный ответ
+        logger.exception('Ошибка потоковой выдачи объявлений')
+        raise
+    if stream == 'json':
+        yield b']'
+
+
+async def astream_body(query, stream, fetch):
+    if stream == 'json':
+        yield b'['
+    position = None
+    first = True
+    try:
+        while True:
+            rows = await fetch(query, position)
+            if rows:
+                yield encode_chunk(rows, stream, first, query['compact'])
+                first = False
+                position = rows[-1][:2]
+            if len(rows) < CHUNK_SIZE:
+                break
+    except Exception:
+        logger.exception('Ошибка потоковой выдачи объявлений')
+        raise
+    if stream == 'json':
+        yield b']'
@@ -1,18 +1,40 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 from .views import TaskViewSet
 
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet)
 
 urlpatterns = [
-     path('apartments/', views.apartment_create_list,
-          name='apartment-create-list'),
-     path('apartments/<int:pk>/', views.apartment_detail,
-          name='apartment-detail'),
+     path('apartments/bulk/', views.apartment_bulk_create,
+          name='apartment-bulk-create'),
+     path('apartments/matches/', views.apartment_task_matches,
+          name='apartment-task-matches'),
+     path('deliveries/', views.delivery_list, name='delivery-list'),
+     path('deliveries/ack/', views.delivery_ack, name='delivery-ack'),
+     path('cache/stats/', views.cache_stats, name='cache-stats'),
      path('', include(router.urls)),
      path('tasks/delete-by-user-id/',
           TaskViewSet.as_view({'delete': 'delete_by_user_id'}),
           name='delete-task-by-user-id'),
 ]
+
+# Под ASGI опросы бота обслуживаются асинхронными представлениями
+if settings.ASYNC_VIEWS:
+    urlpatterns = [
+         path('apartments/', async_views.apartment_create_list_async,
+              name='apartment-create-list'),
+         path('apartments/<int:pk>/', async_views.apartment_detail_async,
+              name='apartment-detail'),
+         path('tasks/filter-by-user-id/', async_views.task_filter_by_user_id_async,
+              name='task-filter-by-user-id'),
+    ] + urlpatterns
+else:
+    urlpatterns = [
+         path('apartments/', views.apartment_create_list,
+              name='apartment-create-list'),
+         path('apartments/<int:pk>/', views.apartment_detail,
+              name='apartment-detail'),
+    ] + urlpatterns
@@ -3,14 +3,20 @@ from rest_framework import viewsets
 from rest_framework.decorators import api_view
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Apartment, Task
+from .cursor import (apartments_after, clamp_position, decode_cursor, encode_cursor,
+                     freshness_floor, parse_limit)
+from .filters import apartment_filter_q, compile_filters, task_filters
+from . import response_cache
+from .ingest import CREATED, UPDATED, UNCHANGED, upsert_apartments
+from .models import Apartment, Delivery, Task
+from .percolator import match_apartments
+from .rows import apartment_row, apartment_rows, compact
 from .serializers import ApartmentSerializer, TaskSerializer
+from .streaming import CONTENT_TYPES, stream_body
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from django.db import models
-
-from datetime import timedelta
+from django.http import StreamingHttpResponse
 
 
 @api_view(['POST', 'GET'])
@@ -18,97 +24,300 @@ def apartment_create_list(request):
     if request.method == 'POST':
         serializer = ApartmentSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Повторно найденное объявление обновляется, а не отклоняется;
+            # в ответе, как и раньше, сохраненная запись с ее id
+            data = serializer.validated_data
+            [(result, _)] = upsert_apartments([data])
+            stored = apartment_row(Apartment.objects.filter(
+                src=data['src'], internalId=data['internalId']))
+            return Response(stored,
+                            status=status.HTTP_201_CREATED if result == CREATED
+                            else status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'GET':
-        city = request.query_params.get('city')
-        last_sent_date = request.query_params.get('last_sent_date')
-        reporters = request.query_params.getlist('reporters')
-        sizes = request.query_params.getlist('sizes')
-        min_price = request.query_params.get('min_price')
-        max_price = request.query_params.get('max_price')
-        districts = request.query_params.getlist('districts')
-        property_types = request.query_params.getlist('property_types')
-
-        rooms = request.query_params.getlist('rooms')
-
-        allowed_minutes_ago = timezone.now() - timedelta(minutes=30)
-
-        if last_sent_date:
-            last_sent_date = parse_datetime(last_sent_date)
-            if last_sent_date is not None:
-                if last_sent_date.tzinfo is None:
-                    last_sent_date = timezone.make_aware(
-                        last_sent_date, timezone.get_current_timezone())
-
-                if last_sent_date < allowed_minutes_ago:
-                    last_sent_date = allowed_minutes_ago
-            else:
-                return Response({'error': 'Invalid date format'},
+        # Потоковая выдача (?stream=json|ndjson) без ограничения limit:
+        # объявления читаются из БД и отправляются порциями
+        stream = request.query_params.get('stream')
+        if stream:
+            if stream not in CONTENT_TYPES:
+                return Response({'error': 'Invalid stream'},
                                 status=status.HTTP_400_BAD_REQUEST)
-        else:
-            last_sent_date = allowed_minutes_ago
+            try:
+                query = parse_list_params(request.query_params)
+            except ValueError as e:
+                return Response({'error': str(e)},
+                                status=status.HTTP_400_BAD_REQUEST)
+            return StreamingHttpResponse(stream_body(query, stream),
+                                         content_type=CONTENT_TYPES[stream])
 
+        data, code = list_apartments(request.query_params)
+        return Response(data, status=code)
+
+
+# Разбор query-параметров выдачи объявлений: фильтры бота (или задачи),
+# курсор, limit и last_sent_date. ValueError при неверных значениях
+def parse_list_params(params):
+    last_sent_date = params.get('last_sent_date')
+
+    # ?task=<id> - сохраненные фильтры задачи вместо параметров запроса
+    task_id = params.get('task')
+    if task_id:
         try:
-            apartments = Apartment.objects.filter(city__iexact=city)
-            if last_sent_date:
-                apartments = apartments.filter(insertedAt__gt=last_sent_date)
-            if reporters:
-                apartments = apartments.filter(reporter__in=reporters)
-            if sizes:
-                size_query = models.Q()
-                for size_range in sizes:
-                    if size_range.startswith('<'):
-                        try:
-                            max_size = int(size_range[1:])
-                            size_query |= models.Q(size__lt=max_size)
-                        except ValueError:
-                            continue
-                    elif size_range.startswith('>'):
-                        try:
-                            min_size = int(size_range[1:])
-                            size_query |= models.Q(size__gt=min_size)
-                        except ValueError:
-                            continue
-                    else:
-                        try:
-                            min_size, max_size = map(
-                                int, size_range.split('-'))
-                            size_query |= models.Q(size__gte=min_size,
-                                                   size__lte=max_size)
-                        except ValueError:
-                            continue
-                apartments = apartments.filter(size_query)
-            if min_price:
-                apartments = apartments.filter(price__gte=min_price)
-            if max_price:
-                apartments = apartments.filter(price__lte=max_price)
-            if districts:
-                apartments = apartments.filter(district__in=districts)
-            if property_types:
-                apartments = apartments.filter(type__in=property_types)
-            if rooms:
-                apartments = apartments.filter(rooms__in=rooms)
-            apartments = apartments.order_by('insertedAt')
-
-            serializer = ApartmentSerializer(apartments, many=True)
-            return Response(serializer.data)
-        except Exception:
-            return Response({'error': 'Server error'},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            task = Task.objects.get(pk=int(task_id))
+        except (ValueError, Task.DoesNotExist):
+            raise ValueError('Invalid task')
+        filters = task_filters(task)
+    else:
+        filters = compile_filters({
+            'city': params.get('city'),
+            'reporters': params.getlist('reporters'),
+            'sizes': params.getlist('sizes'),
+            'min_price': params.get('min_price'),
+            'max_price': params.get('max_price'),
+            'districts': params.getlist('districts'),
+            'property_types': params.getlist('property_types'),
+            'rooms': params.getlist('rooms'),
+        })
 
+    # Постраничная выдача по курсору (insertedAt, id): ответ ограничен
+    # limit записями, next_cursor указывает на последнюю из них
+    cursor = params.get('cursor')
+    limit = parse_limit(params.get('limit'))
+    position = decode_cursor(cursor) if cursor else None
 
+    allowed_minutes_ago = freshness_floor()
+    if position:
+        position = clamp_position(position, allowed_minutes_ago)
+
+    if last_sent_date:
+        last_sent_date = parse_datetime(last_sent_date)
+        if last_sent_date is None:
+            raise ValueError('Invalid date format')
+        if last_sent_date.tzinfo is None:
+            last_sent_date = timezone.make_aware(
+                last_sent_date, timezone.get_current_timezone())
+
+        if last_sent_date < allowed_minutes_ago:
+            last_sent_date = allowed_minutes_ago
+    else:
+        last_sent_date = allowed_minutes_ago
+
+    return {
+        'filters': filters,
+        'cursor': cursor,
+        'paginated': cursor is not None or 'limit' in params,
+        'limit': limit,
+        'position': position,
+        'last_sent_date': last_sent_date,
+        'compact': params.get('compact') == '1',
+    }
+
+
+# Выдача объявлений по фильтрам бота из query-параметров.
+# Общая для синхронного и асинхронного представлений, возвращает (данные, статус)
+def list_apartments(params):
+    try:
+        query = parse_list_params(params)
+    except ValueError as e:
+        return {'error': str(e)}, status.HTTP_400_BAD_REQUEST
+
+    filters = query['filters']
+    cursor = query['cursor']
+    paginated = query['paginated']
+    limit = query['limit']
+    position = query['position']
+    last_sent_date = query['last_sent_date']
+    try:
+        apartments = Apartment.objects.filter(
+            apartment_filter_q(filters)).order_by('insertedAt', 'id')
+        since = position[0] if position else last_sent_date
+        if response_cache.cacheable(since):
+            # Одинаковые фильтры из одного временного окна читают
+            # общую запись кэша, точная граница применяется ниже
+            rows = response_cache.get_rows(
+                filters, since,
+                lambda start: apartment_rows(apartments.filter(insertedAt__gte=start)))
+        else:
+            apartments = apartments_after(apartments, position, last_sent_date)
+            rows = apartment_rows(apartments[:limit + 1] if paginated else apartments)
+
+        if position:
+            rows = [row for row in rows if row[:2] > position]
+        else:
+            rows = [row for row in rows if row[0] > last_sent_date]
+
+        # Компактный ответ: короткие ключи, без служебных полей
+        output = compact if query['compact'] else None
+        if not paginated:
+            return [output(data) if output else data for _, _, data in rows], status.HTTP_200_OK
+
+        page = rows[:limit]
+        has_more = len(rows) > limit
+        if page:
+            next_cursor = encode_cursor(*page[-1][:2])
+        elif position:
+            # Устаревший курсор заменяется началом окна свежести
+            next_cursor = encode_cursor(*position)
+        else:
+            next_cursor = cursor
+        return {'results': [output(data) if output else data for _, _, data in page],
+                'next_cursor': next_cursor,
+                'has_more': has_more}, status.HTTP_200_OK
+    except Exception:
+        return {'error': 'Server error'}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+# Новые объявления сразу для всех готовых задач: одна выборка новых записей
+# после курсора, задачи для каждого объявления находятся по обратному
+# индексу задач. Стоимость опроса зависит от числа новых объявлений,
+# а не от числа задач
 @api_view(['GET'])
-def apartment_detail(request, pk):
+def apartment_task_matches(request):
+    cursor = request.query_params.get('cursor')
+    try:
+        limit = parse_limit(request.query_params.get('limit'))
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return Response({'error': str(e)},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    floor = freshness_floor()
+    if position:
+        position = clamp_position(position, floor)
+    apartments = apartments_after(Apartment.objects.all(), position, floor)
+    page = list(apartments.order_by('insertedAt', 'id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    found = match_apartments(page)
+    task_ids = set().union(*found.values())
+    # Задача могла быть удалена или снята с готовности после перестроения индекса
+    users = dict(Task.objects.filter(id__in=task_ids, isReady=True)
+                 .values_list('id', 'user_id')) if task_ids else {}
+
+    matches = {}
+    matched = []
+    for apartment in page:
+        ids = sorted(found[apartment.id] & users.keys())
+        for task_id in ids:
+            matches.setdefault(task_id, []).append(apartment.id)
+        if ids:
+            matched.append(apartment)
+
+    if page:
+        next_cursor = encode_cursor(page[-1].insertedAt, page[-1].id)
+    elif position:
+        next_cursor = encode_cursor(*position)
+    else:
+        next_cursor = cursor
+    return Response({
+        'results': [{'task_id': task_id, 'user_id': users[task_id], 'apartments': ids}
+                    for task_id, ids in matches.items()],
+        'apartments': ApartmentSerializer(matched, many=True).data,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    })
+
+
+# Пакетная загрузка объявлений: проверка без запросов к БД и один
+# INSERT ... ON CONFLICT на всю пачку, результат по каждому объявлению
+@api_view(['POST'])
+def apartment_bulk_create(request):
+    items = request.data
+    if not isinstance(items, list):
+        return Response({'error': 'Ожидается массив объявлений'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    results = []
+    valid = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results.append({'index': index, 'status': 'errored',
+                            'errors': {'non_field_errors': ['Ожидается объект']}})
+            continue
+
+        result = {'index': index, 'internalId': item.get('internalId')}
+        results.append(result)
+        serializer = ApartmentSerializer(data=item)
+        if not serializer.is_valid():
+            result['status'] = 'errored'
+            result['errors'] = serializer.errors
+            continue
+        valid.append((result, serializer.validated_data))
+
+    upserted = upsert_apartments([data for _, data in valid])
+    for (result, _), (outcome, pk) in zip(valid, upserted):
+        result['status'] = outcome
+        result['id'] = pk
+
+    summary = {key: 0 for key in (CREATED, UPDATED, UNCHANGED, 'errored')}
+    for result in results:
+        summary[result['status']] += 1
+    return Response({**summary, 'results': results})
+
+
+# Очередь доставки, заполняемая при загрузке объявлений: бот забирает
+# записи (для одного пользователя, если задан user_id) и подтверждает отправку
+@api_view(['GET'])
+def delivery_list(request):
+    try:
+        limit = parse_limit(request.query_params.get('limit'))
+    except ValueError as e:
+        return Response({'error': str(e)},
+                        status=status.HTTP_400_BAD_REQUEST)
+    user_id = request.query_params.get('user_id')
     try:
-        apartment = Apartment.objects.get(pk=pk)
-    except Apartment.DoesNotExist:
+        user_id = int(user_id) if user_id else None
+    except ValueError:
+        return Response({'error': 'Invalid user_id'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    deliveries = Delivery.objects.select_related('task', 'apartment').order_by('id')
+    if user_id is not None:
+        deliveries = deliveries.filter(task__user_id=user_id)
+    page = list(deliveries[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    apartments = ApartmentSerializer([delivery.apartment for delivery in page], many=True).data
+    return Response({
+        'results': [{'id': delivery.id, 'task_id': delivery.task_id,
+                     'user_id': delivery.task.user_id, 'apartment': apartment}
+                    for delivery, apartment in zip(page, apartments)],
+        'has_more': has_more,
+    })
+
+
+@api_view(['POST'])
+def delivery_ack(request):
+    ids = request.data.get('ids') if isinstance(request.data, dict) else None
+    if not isinstance(ids, list):
+        return Response({'detail': 'Отсутствует ids.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    # bool - подкласс int, но id записи им быть не может
+    if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        return Response({'error': 'Invalid ids'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    deleted, _ = Delivery.objects.filter(id__in=ids).delete()
+    return Response({'deleted': deleted})
+
+
+# Счетчики попаданий и промахов кэша выдачи объявлений
+@api_view(['GET'])
+def cache_stats(request):
+    return Response(response_cache.stats())
+
+
+@api_view(['GET'])
+def apartment_detail(request, pk):
+    data = apartment_row(Apartment.objects.filter(pk=pk))
+    if data is None:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    serializer = ApartmentSerializer(apartment)
-    return Response(serializer.data)
+    if request.query_params.get('compact') == '1':
+        data = compact(data)
+    return Response(data)
 
 
 class TaskViewSet(viewsets.ModelViewSet):
@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+CITIES = ['Белград', 'Нови Сад']
+
+
+# Клиент, повторяющий опрос бота: GET /api/apartments/ с фильтрами задачи
+async def poll(client, url, deadline, timings, errors):
+    while time.perf_counter() < deadline:
+        params = {'city': random.choice(CITIES), 'limit': 100}
+        if random.random() < 0.5:
+            params['rooms'] = random.choice(['1', '2', '3', '4+'])
+        start = time.perf_counter()
+        try:
+            response = await client.get(url, params=params)
+            if response.status_code == 200:
+                timings.append(time.perf_counter() - start)
+            else:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+
+async def run(url, clients, duration):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    timings = []
+    errors = []
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(poll(client, url, deadline, timings, errors)
+                               for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return timings, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный тест опроса объявлений параллельными клиентами')
+    parser.add_argument('--url', default='http://localhost:8000/api/apartments/')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30, help='секунды')
+    args = parser.parse_args()
+
+    timings, errors, elapsed = asyncio.run(run(args.url, args.clients, args.duration))
+    if not timings:
+        print(f'Нет успешных ответов, ошибки: {errors[:10]}')
+        return
+
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f'Клиентов: {args.clients}, запросов: {len(timings)}, ошибок: {len(errors)}')
+    print(f'Пропускная способность: {len(timings) / elapsed:.1f} запросов/с')
+    print(f'p50: {statistics.median(timings) * 1000:.1f} мс, p99: {p99 * 1000:.1f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,8 +12,17 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Режим сервера API (см. start.sh): sync - WSGI, async - gunicorn
+# с uvicorn-воркерами и асинхронными представлениями опроса
+API_SERVER_MODE = os.getenv('API_SERVER_MODE', 'sync')
+ASYNC_VIEWS = API_SERVER_MODE == 'async'
+
 REST_FRAMEWORK = {
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # Application definition
@@ -67,6 +76,32 @@ DATABASES = {
     }
 }
 
+# Кэш выдачи объявлений: locmem (свой в каждом процессе), file или redis
+# (общий для всех процессов API)
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'rentbot'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', '/tmp/rentbot_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://localhost:6379/1'),
+}
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[os.getenv('API_CACHE_BACKEND', 'locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('API_CACHE_LOCATION', CACHE_LOCATION),
+    }
+}
+# Версия выдачи и счетчики попаданий должны быть общими для всех процессов
+# API, иначе загрузка объявлений в одном процессе не сбросит кэш остальных.
+# При locmem они хранятся в файловом кэше, строки выдачи остаются в памяти
+if CACHE_BACKEND == CACHE_BACKENDS['locmem'][0]:
+    CACHES['shared'] = {
+        'BACKEND': CACHE_BACKENDS['file'][0],
+        'LOCATION': os.getenv('API_CACHE_SHARED_LOCATION', '/tmp/rentbot_cache_shared'),
+    }
+else:
+    CACHES['shared'] = CACHES['default']
+
 '''DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -1,5 +1,9 @@
+import hashlib
 import json
 
+# Поля, которые API обновляет у повторно найденного объявления
+MUTABLE_FIELDS = ('price', 'currency', 'rooms', 'size', 'reporter', 'image_url', 'url')
+
 
 class Apartment:
     def __init__(self, city, district, price, currency,
@@ -24,7 +28,10 @@ class Apartment:
         return f'src: {self.src}, internalId: {self.internalId}, city: {self.city}'
 
     def convertToJson(self) -> str:
-        return json.dumps({
+        return json.dumps(self.toDict())
+
+    def toDict(self) -> dict:
+        return {
             "src": self.src,
             "city": self.city,
             "district": self.district,
@@ -38,4 +45,11 @@ class Apartment:
             "internalId": self.internalId,
             "image_url": self.image_url,
             "url": self.url
-        })
+        }
+
+    # Хэш изменяемых полей: по нему парсер замечает, что у уже отправленного
+    # объявления поменялись цена, фото и т.п., и отправляет его повторно
+    def fields_hash(self) -> str:
+        values = json.dumps([getattr(self, name) for name in MUTABLE_FIELDS],
+                            ensure_ascii=False)
+        return hashlib.sha1(values.encode('utf-8')).hexdigest()
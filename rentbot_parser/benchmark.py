@@ -0,0 +1,220 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import requests
+
+from extractor import ADV_TYPES, extract_listings
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, 'fixtures')
+# Базовые замеры зависят от машины, поэтому хранятся локально (файл не
+# в репозитории) и отдельно для каждой машины и версии Python
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+# Ожидаемый результат разбора страниц: не зависит от машины и хранится
+# в репозитории, проверка корректности работает на любой машине
+EXPECTED_PATH = os.path.join(BENCHMARKS_DIR, 'expected.json')
+BASE_URL = 'https://www.halooglasi.com'
+
+
+# Машина, для которой сохранен базовый замер
+def machine_key():
+    return f'{platform.node()}/{platform.machine()}/python-{platform.python_version()}'
+
+
+# Страницы результатов, записанные с сайта через --record,
+# в файлах вида <тип>_<город>_<страница>.html
+def load_fixtures():
+    fixtures = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if not name.endswith('.html'):
+            continue
+        avd_type = name.split('_')[0]
+        if avd_type not in ADV_TYPES:
+            continue
+        with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+            fixtures.append((name, avd_type, f.read()))
+    return fixtures
+
+
+# Полный путь страницы в парсере: разбор HTML и сериализация объявлений
+def process(fixtures):
+    listings = 0
+    for _, avd_type, page_source in fixtures:
+        result = extract_listings(page_source, avd_type, BASE_URL, datetime.min)
+        for apartment in result.apartments:
+            apartment.convertToJson()
+        listings += len(result.apartments)
+    return listings
+
+
+# Результат разбора одной страницы: число объявлений и хэши их полей.
+# Дата published проставляется парсером в момент разбора и не сравнивается
+def extract_summary(avd_type, page_source):
+    result = extract_listings(page_source, avd_type, BASE_URL, datetime.min)
+    hashes = []
+    for apartment in result.apartments:
+        fields = apartment.toDict()
+        del fields['published']
+        value = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+        hashes.append(hashlib.sha1(value.encode('utf-8')).hexdigest())
+    return {
+        'total': result.total,
+        'listings': len(result.apartments),
+        'errors': len(result.errors),
+        'hashes': hashes,
+    }
+
+
+def load_expected():
+    if not os.path.exists(EXPECTED_PATH):
+        return {}
+    with open(EXPECTED_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_expected(expected):
+    with open(EXPECTED_PATH, 'w', encoding='utf-8') as f:
+        json.dump(expected, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+
+# Сравнение разбора страниц с ожидаемым результатом, список
+# страниц, разобранных иначе (или без ожидаемого результата)
+def check(fixtures, expected):
+    failed = []
+    for name, avd_type, page_source in fixtures:
+        summary = extract_summary(avd_type, page_source)
+        if name not in expected:
+            print(f'{name}: нет ожидаемого результата, сохраните его: --update-expected')
+            failed.append(name)
+        elif summary != expected[name]:
+            want = expected[name]
+            changed = sum(1 for a, b in zip(summary['hashes'], want['hashes']) if a != b)
+            print(f"{name}: объявлений {summary['listings']} (ожидалось {want['listings']}), "
+                  f"ошибок {summary['errors']} (ожидалось {want['errors']}), "
+                  f'изменилось полей объявлений: {changed}')
+            failed.append(name)
+    return failed
+
+
+def run(fixtures, iterations):
+    # Прогрев: импорт, компиляция селекторов, кэши lxml
+    process(fixtures)
+
+    start = time.perf_counter()
+    listings = 0
+    for _ in range(iterations):
+        listings += process(fixtures)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    process(fixtures)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    pages = len(fixtures) * iterations
+    return {
+        'pages_per_sec': round(pages / elapsed, 1),
+        'listings_per_sec': round(listings / elapsed, 1),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+# Сравнение с сохраненным результатом: скорость не должна падать,
+# а память расти больше чем на tolerance
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key in ('pages_per_sec', 'listings_per_sec'):
+        if results[key] < baseline[key] * (1 - tolerance):
+            regressions.append(key)
+    if results['peak_memory_kb'] > baseline['peak_memory_kb'] * (1 + tolerance):
+        regressions.append('peak_memory_kb')
+
+    for key, value in results.items():
+        change = (value - baseline[key]) / baseline[key] * 100 if baseline[key] else 0
+        mark = '  <-- регрессия' if key in regressions else ''
+        print(f'{key:>18}: {value:>10} (базовое {baseline[key]}, {change:+.1f}%){mark}')
+    return regressions
+
+
+# Сохранение живой страницы результатов в набор страниц для замеров
+def record(url, name):
+    # fetcher тянет selenium, для прогона замеров он не нужен
+    from fetcher import HEADERS
+
+    response = requests.get(url, headers=HEADERS, timeout=20)
+    response.raise_for_status()
+    path = os.path.join(FIXTURES_DIR, f'{name}.html')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(response.text)
+
+    # Ожидаемый результат записывается вместе со страницей: его стоит
+    # просмотреть перед коммитом, дальше он ловит изменения разбора
+    expected = load_expected()
+    expected[f'{name}.html'] = extract_summary(name.split('_')[0], response.text)
+    save_expected(expected)
+    print(f"Сохранено: {path}, объявлений: {expected[f'{name}.html']['listings']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер скорости разбора страниц результатов')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='допустимое ухудшение относительно базового замера')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--update-expected', action='store_true',
+                        help='сохранить текущий результат разбора как ожидаемый')
+    parser.add_argument('--record', nargs=2, metavar=('URL', 'NAME'),
+                        help='сохранить страницу, NAME вида izdavanje-stanova_beograd_1')
+    args = parser.parse_args()
+
+    if args.record:
+        record(*args.record)
+        return
+
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f'Нет страниц в {FIXTURES_DIR}, запишите их с сайта: --record URL NAME')
+        sys.exit(1)
+
+    if args.update_expected:
+        save_expected({name: extract_summary(avd_type, page_source)
+                       for name, avd_type, page_source in fixtures})
+        print(f'Ожидаемый результат сохранен: {EXPECTED_PATH}')
+        return
+
+    # Сначала корректность: замер скорости неверного разбора не нужен
+    failed = check(fixtures, load_expected())
+    if failed:
+        sys.exit(1)
+
+    results = run(fixtures, args.iterations)
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding='utf-8') as f:
+            baselines = json.load(f)
+    machine = machine_key()
+
+    if args.update_baseline or machine not in baselines:
+        baselines[machine] = results
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=4)
+            f.write('\n')
+        print(json.dumps(results, indent=4))
+        print(f'Базовый замер для {machine} сохранен: {BASELINE_PATH}')
+        return
+
+    if compare(results, baselines[machine], args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import fcntl
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+
+
+# Блокировка на файле: одновременно работает только один парсер
+# (демон или запуск по cron)
+class RunLock:
+    def __init__(self, path) -> None:
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        # Без усечения при открытии: иначе неудачная попытка стерла бы
+        # pid работающего процесса
+        self._file = open(self.path, 'a+')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+# Расписание сегмента (тип, город): интервал подстраивается под скорость
+# появления новых объявлений так, чтобы за один обход находилось около
+# target_new объявлений, но не выходил за пределы [min_interval, max_interval]
+class SegmentSchedule:
+    # Вес последнего наблюдения в скользящей средней скорости
+    SMOOTHING = 0.5
+
+    def __init__(self, avd_type, grad, min_interval, max_interval, target_new) -> None:
+        self.avd_type = avd_type
+        self.grad = grad
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new = target_new
+        self.interval = min_interval
+        self.next_run = 0.0
+        self.last_run = None
+        # Новых объявлений в секунду
+        self.rate = 0.0
+
+    def record(self, new, now):
+        if self.last_run is not None:
+            observed = new / max(now - self.last_run, 1)
+            self.rate = self.SMOOTHING * observed + (1 - self.SMOOTHING) * self.rate
+
+        if self.rate > 0:
+            interval = self.target_new / self.rate
+        else:
+            interval = self.interval * 2
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+        self.last_run = now
+        self.next_run = now + self.interval
+
+    def __str__(self) -> str:
+        return f'{self.avd_type}/{self.grad}'
+
+
+class AdaptiveScheduler:
+    def __init__(self, segments, min_interval=120, max_interval=3600, target_new=5) -> None:
+        self.segments = [SegmentSchedule(avd_type, grad, min_interval, max_interval, target_new)
+                         for avd_type, grad in segments]
+
+    def due(self, now):
+        return [segment for segment in self.segments if segment.next_run <= now]
+
+    def sleep_until_due(self):
+        delay = min(segment.next_run for segment in self.segments) - time.time()
+        if delay > 0:
+            logger.info(f'Следующий обход через {delay:.0f} с')
+            time.sleep(delay)
+
+    def record(self, segment, new, now):
+        segment.record(new, now)
+        logger.info(f'{segment}: новых объявлений {new}, '
+                    f'следующий обход через {segment.interval:.0f} с')
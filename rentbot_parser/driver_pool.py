@@ -0,0 +1,144 @@
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+logger = logging.getLogger()
+
+_driver_path = os.getenv('CHROMEDRIVER_PATH')
+_driver_path_lock = threading.Lock()
+
+
+# Путь к chromedriver определяется один раз за запуск,
+# ChromeDriverManager().install() ходит в сеть при каждом вызове
+def get_driver_path():
+    global _driver_path
+    with _driver_path_lock:
+        if not _driver_path:
+            _driver_path = ChromeDriverManager().install()
+            logger.info(f'Chromedriver: {_driver_path}')
+    return _driver_path
+
+
+def setup_driver():
+    options = webdriver.ChromeOptions()
+    options.add_argument('--no-sandbox')
+    options.add_argument('--headless')
+    options.add_argument('--log-level=3')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    prefs = {"profile.managed_default_content_settings.images": 2}
+    options.add_experimental_option("prefs", prefs)
+    return webdriver.Chrome(service=Service(get_driver_path()), options=options)
+
+
+# Пул браузеров: экземпляры запускаются по мере необходимости (не больше size),
+# переиспользуются между страницами и пересоздаются после max_pages страниц
+# или после сбоя
+class DriverPool:
+    def __init__(self, size=2, max_pages=20) -> None:
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages)
+        self._idle = queue.LifoQueue()
+        self._pages = {}
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            driver = self._take(deadline)
+            if self._is_alive(driver):
+                return driver
+            logger.error('Браузер не отвечает, пересоздаем')
+            self._destroy(driver)
+
+    def release(self, driver, broken=False):
+        with self._lock:
+            self._pages[id(driver)] = self._pages.get(id(driver), 0) + 1
+            pages = self._pages[id(driver)]
+
+        if broken or self._closed:
+            self._destroy(driver)
+        elif pages >= self.max_pages:
+            logger.info(f'Браузер обработал {pages} страниц, пересоздаем')
+            self._destroy(driver)
+        else:
+            self._idle.put(driver)
+
+    @contextmanager
+    def driver(self, timeout=None):
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, broken=True)
+            raise
+        else:
+            self.release(driver)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._destroy(driver)
+
+    def _take(self, deadline):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self._lock:
+                can_spawn = self._created < self.size
+                if can_spawn:
+                    self._created += 1
+            if can_spawn:
+                return self._spawn()
+
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError('Нет свободных браузеров в пуле')
+            # Ждем освобождения браузера; периодически проверяем,
+            # не освободилось ли место под новый экземпляр
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def _spawn(self):
+        try:
+            driver = setup_driver()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        logger.info('Запущен новый браузер')
+        return driver
+
+    def _destroy(self, driver):
+        with self._lock:
+            self._created -= 1
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.error(f'Ошибка при закрытии браузера: {str(e)}')
+
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.execute_script('return 1')
+            return True
+        except Exception:
+            return False
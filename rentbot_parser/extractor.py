@@ -0,0 +1,179 @@
+import hashlib
+import re
+import time
+from datetime import datetime
+
+import pytz
+from lxml import etree, html
+
+from apartment import Apartment
+
+SRC = 'halooglasi'
+
+ADV_TYPES = {
+    'izdavanje-stanova': 'stan',
+    'izdavanje-kuca': 'kuća',
+}
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Селекторы компилируются один раз при импорте модуля
+LISTINGS = etree.XPath(
+    f"//div[{_has_class('product-item')} and not({_has_class('banner-list')})]")
+VALUE_WRAPPERS = etree.XPath(f".//div[{_has_class('value-wrapper')}]")
+PRICE = etree.XPath('.//span[@data-value]/@data-value')
+LINK = etree.XPath('.//a[@href]')
+PLACES = etree.XPath('.//li')
+
+# Ссылки, цены и даты объявлений: по ним считается отпечаток страницы
+FINGERPRINT_TOKENS = re.compile(
+    r'href="(/nekretnine/[^"]*)"|data-value="([^"]*)"|publish-date"[^>]*>([^<]*)')
+
+# Классы элементов, которые ищутся за один обход объявления
+FIELD_CLASSES = frozenset((
+    'publish-date', 'product-title', 'resized-image', 'product-features',
+    'central-feature-wrapper', 'basic-info', 'subtitle-places',
+))
+
+
+# Результат разбора страницы
+class ExtractResult:
+    def __init__(self) -> None:
+        # Новые и изменившиеся объявления, готовые к отправке в API
+        self.apartments = []
+        # Всего объявлений на странице
+        self.total = 0
+        # Отправленные ранее без изменений или опубликованные раньше published_since
+        self.skipped = 0
+        # Пары (номер объявления на странице, поле), которые не удалось разобрать
+        self.errors = []
+        # Время разбора в секундах
+        self.elapsed = 0.0
+
+
+def _text(element):
+    if element is None:
+        return None
+    return ''.join(part.strip() for part in element.itertext())
+
+
+def _scan(listing):
+    found = {}
+    for element in listing.iter():
+        classes = element.get('class')
+        if not classes:
+            continue
+        for name in classes.split():
+            if name in FIELD_CLASSES and name not in found:
+                found[name] = element
+    return found
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%d.%m.%Y.')
+    except (TypeError, ValueError):
+        return None
+
+
+# Отпечаток списка объявлений без разбора HTML: меняется, если на странице
+# появилось, пропало или изменилось хотя бы одно объявление
+# None, если в разметке не нашлось ни одного объявления
+def fingerprint(page_source):
+    start = page_source.find('product-list')
+    if start == -1:
+        return None
+    digest = hashlib.sha1()
+    found = False
+    for match in FINGERPRINT_TOKENS.finditer(page_source, start):
+        found = True
+        digest.update(match.group(0).encode('utf-8'))
+    return digest.hexdigest() if found else None
+
+
+# Разбор HTML страницы результатов в список объектов Apartment.
+# Объявления старше published_since пропускаются до разбора полей,
+# а те, для которых is_known(apartment) возвращает True, - после
+def extract_listings(page_source, avd_type, base_url, published_since, is_known=None):
+    start = time.perf_counter()
+    result = ExtractResult()
+    tree = html.document_fromstring(page_source)
+
+    published = datetime.now(pytz.timezone('Europe/Belgrade')).strftime('%d.%m.%Y. u %H:%M')
+    type = ADV_TYPES.get(avd_type, '')
+
+    for index, listing in enumerate(LISTINGS(tree)):
+        result.total += 1
+        found = _scan(listing)
+
+        publish_date = _parse_date(_text(found.get('publish-date')))
+        if publish_date is None:
+            result.errors.append((index, 'publish-date'))
+            continue
+        if publish_date < published_since:
+            result.skipped += 1
+            continue
+
+        title = found.get('product-title')
+        links = LINK(title) if title is not None else []
+        if not links:
+            result.errors.append((index, 'product-title'))
+            continue
+        url = base_url + links[0].get('href')
+        internalId = url.split('/')[-1].split('?')[0]
+
+        fields = _extract_fields(found)
+        missing = [name for name, value in fields.items() if value is None]
+        if missing:
+            result.errors.extend((index, name) for name in missing)
+            continue
+
+        image = found.get('resized-image')
+        apartment = Apartment(city=fields['city'], district=fields['district'],
+                              price=fields['price'], currency='€',
+                              type=type, rooms=fields['rooms'], size=fields['size'],
+                              reporter=fields['reporter'], published=published,
+                              internalId=internalId, src=SRC,
+                              image_url=image.get('src', '') if image is not None else '',
+                              url=url)
+        # Уже отправленное объявление без изменений цены, фото и т.п.
+        if is_known is not None and is_known(apartment):
+            result.skipped += 1
+            continue
+        result.apartments.append(apartment)
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _extract_fields(found):
+    fields = {'size': None, 'rooms': None, 'price': None,
+              'reporter': None, 'city': None, 'district': None}
+
+    features = found.get('product-features')
+    if features is not None:
+        values = VALUE_WRAPPERS(features)
+        if len(values) > 0 and values[0].text:
+            fields['size'] = values[0].text.strip().replace(' m', '')
+        if len(values) > 1 and values[1].text:
+            fields['rooms'] = values[1].text.strip()
+
+    price_wrapper = found.get('central-feature-wrapper')
+    if price_wrapper is not None:
+        prices = PRICE(price_wrapper)
+        if prices:
+            fields['price'] = prices[0]
+
+    fields['reporter'] = _text(found.get('basic-info'))
+
+    places = found.get('subtitle-places')
+    if places is not None:
+        items = PLACES(places)
+        if len(items) > 1:
+            fields['city'] = _text(items[0])
+            fields['district'] = _text(items[1])
+
+    return fields
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger()
+
+STRATEGY_HTTP = 'http'
+STRATEGY_BROWSER = 'selenium'
+
+LISTINGS_MARKERS = ('product-list', 'product-item')
+
+HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'sr-RS,sr;q=0.9,en;q=0.8',
+}
+
+
+def has_listings(html):
+    return bool(html) and all(marker in html for marker in LISTINGS_MARKERS)
+
+
+# Ожидание загрузки контента JS скриптами
+def wait_for_images(driver, tag, timeout=60):
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_all_elements_located((By.CSS_SELECTOR, tag))
+        )
+    except Exception as e:
+        logger.error(f'Ошибка при ожидании: {str(e)}')
+
+
+# Загруженная страница результатов
+class Page:
+    def __init__(self, html, etag=None, last_modified=None, not_modified=False) -> None:
+        self.html = html
+        # Валидаторы для условного запроса при следующем запуске
+        self.etag = etag
+        self.last_modified = last_modified
+        # Сервер ответил 304: страница не менялась с прошлой загрузки
+        self.not_modified = not_modified
+
+
+# Загрузка страниц результатов: сначала обычным HTTP-запросом через
+# keep-alive сессию, браузер из пула запускается только если в HTML
+# нет разметки со списком объявлений
+class PageFetcher:
+    def __init__(self, pool, rate_limiter=None, http_pool_size=10, timeout=20) -> None:
+        self.pool = pool
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=http_pool_size,
+                              pool_maxsize=http_pool_size,
+                              max_retries=Retry(total=2, backoff_factor=0.5,
+                                                status_forcelist=[502, 503, 504]))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.stats = {STRATEGY_HTTP: 0, STRATEGY_BROWSER: 0}
+        self._lock = threading.Lock()
+
+    # Возвращает Page или None, если объявлений на странице нет
+    # etag и last_modified от прошлой загрузки отправляются в условном запросе
+    def fetch(self, url, etag=None, last_modified=None):
+        start = time.perf_counter()
+        try:
+            page = self._fetch_http(url, etag, last_modified)
+        except requests.RequestException as e:
+            logger.error(f'Ошибка HTTP-загрузки {url}: {str(e)}')
+            page = None
+
+        if page is not None and (page.not_modified or has_listings(page.html)):
+            self._log(STRATEGY_HTTP, url, start)
+            return page
+
+        html = self._fetch_browser(url)
+        self._log(STRATEGY_BROWSER, url, start)
+        return Page(html) if 'product-list' in html else None
+
+    def close(self):
+        self.session.close()
+        logger.info(f'Загрузка страниц: http={self.stats[STRATEGY_HTTP]}, '
+                    f'selenium={self.stats[STRATEGY_BROWSER]}')
+
+    def _fetch_http(self, url, etag, last_modified):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        self._throttle(url)
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return Page(None, etag, last_modified, not_modified=True)
+        if response.status_code != 200:
+            logger.info(f'HTTP {response.status_code}: {url}')
+            return None
+        return Page(response.text, response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'))
+
+    def _fetch_browser(self, url):
+        with self.pool.driver() as driver:
+            self._throttle(url)
+            driver.get(url)
+            driver.implicitly_wait(10)
+            wait_for_images(driver=driver, tag='img.resized-image')
+
+            if 'product-list' not in driver.page_source:
+                return driver.page_source
+
+            wait_for_images(driver=driver, tag='div.product-item:not(.banner-list)')
+            return driver.page_source
+
+    def _throttle(self, url):
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(url)
+
+    def _log(self, strategy, url, start):
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.stats[strategy] += 1
+        logger.info(f'Страница загружена ({strategy}, {elapsed:.0f} мс): {url}')
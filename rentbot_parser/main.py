@@ -1,22 +1,23 @@
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 from dotenv import load_dotenv
+import argparse
+import json
 import os
 import sys
-import pytz
 import requests
 import logging
 import time
+from logging.handlers import RotatingFileHandler
 import psutil
+import threading
 
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-
-from apartment import Apartment
+from daemon import AdaptiveScheduler, RunLock
+from driver_pool import DriverPool
+from extractor import SRC, extract_listings, fingerprint
+from fetcher import PageFetcher
+from page_state import PageState
+from scheduler import HostRateLimiter, PageScheduler
+from seen_cache import SeenCache
 
 load_dotenv()
 
@@ -25,159 +26,238 @@ NUMBER_OF_PAGES = 40 #int(os.getenv('LIMIT'))
 BASE_URL = os.getenv('BASE_URL')
 SEARCH_URL = os.getenv('SEARCH_URL')
 API_URL = f"{os.getenv('API_URL')}apartments/"
+API_BULK_URL = f'{API_URL}bulk/'
+# Максимальное количество объявлений в одном запросе к API
+BULK_SIZE = int(os.getenv('BULK_SIZE', 50))
+# Количество браузеров в пуле и число страниц до пересоздания браузера
+DRIVER_POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE', 2))
+DRIVER_MAX_PAGES = int(os.getenv('DRIVER_MAX_PAGES', 20))
+# Количество одновременно обрабатываемых страниц
+# и ограничение запросов к агрегатору в секунду
+CONCURRENCY = int(os.getenv('CONCURRENCY', 4))
+HOST_RATE_LIMIT = float(os.getenv('HOST_RATE_LIMIT', 2))
+# Кэш отправленных в API объявлений и состояния страниц между запусками
+SEEN_CACHE_PATH = os.getenv('SEEN_CACHE_PATH', '/app/rentbot_parser/seen.sqlite3')
+SEEN_CACHE_TTL = int(os.getenv('SEEN_CACHE_TTL_DAYS', 7)) * 24 * 60 * 60
+# Режим демона: границы интервала между обходами сегмента в секундах
+# и желаемое количество новых объявлений за один обход
+DAEMON_MIN_INTERVAL = int(os.getenv('DAEMON_MIN_INTERVAL', 120))
+DAEMON_MAX_INTERVAL = int(os.getenv('DAEMON_MAX_INTERVAL', 3600))
+DAEMON_TARGET_NEW = int(os.getenv('DAEMON_TARGET_NEW', 5))
+LOCK_PATH = os.getenv('LOCK_PATH', '/app/rentbot_parser/parser.lock')
 LOG_LEVEL = logging.INFO if os.getenv('LOG_LEVEL') == 'INFO' else logging.ERROR
+# Ротация лога в режиме демона: размер файла в байтах и число старых файлов
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
 cities = ['beograd', 'novi-sad']
 adv_types = ['izdavanje-stanova', 'izdavanje-kuca']
+segments = [(avd_type, grad) for avd_type in adv_types for grad in cities]
 
-log_file_path = '/app/rentbot_parser/output.log'
-if os.path.exists(log_file_path):
-    os.remove(log_file_path)
+arg_parser = argparse.ArgumentParser()
+arg_parser.add_argument('--daemon', action='store_true',
+                        help='работать постоянно с адаптивным расписанием сегментов')
+args = arg_parser.parse_args()
+
+# Запуск по cron пропускается, пока работает демон или предыдущий запуск
+run_lock = RunLock(LOCK_PATH)
+if not run_lock.acquire():
+    sys.exit(0)
 
-logging.basicConfig(filename=log_file_path, level=LOG_LEVEL,
-                    format='%(asctime)s %(levelname)s:%(message)s',
-                    encoding='utf-8')
+log_file_path = '/app/rentbot_parser/output.log'
+log_format = '%(asctime)s %(levelname)s:%(message)s'
+if args.daemon:
+    # Демон работает неделями: лог ротируется по размеру, а не удаляется
+    # при каждом запуске
+    log_handler = RotatingFileHandler(log_file_path, maxBytes=LOG_MAX_BYTES,
+                                      backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    logging.basicConfig(handlers=[log_handler], level=LOG_LEVEL, format=log_format)
+else:
+    if os.path.exists(log_file_path):
+        os.remove(log_file_path)
+    logging.basicConfig(filename=log_file_path, level=LOG_LEVEL, format=log_format,
+                        encoding='utf-8')
 logger = logging.getLogger()
 
 
-def invokePost(apartment_json):
+def invokeBulkPost(apartments_json):
     return (
-        requests.post(API_URL,
-                      data=apartment_json,
+        requests.post(API_BULK_URL,
+                      data=apartments_json,
                       headers={'Content-Type': 'application/json'})
     )
 
 
-# Ожидание загрузки контента JS скриптами
-def wait_for_images(driver, tag, timeout=60):
-    try:
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, tag))
-        )
-    except Exception as e:
-        logger.error(f'Ошибка при ожидании: {str(e)}')
+# Отправка объявлений в API пачками по BULK_SIZE
+# Возвращает количество созданных в API объявлений и False,
+# если хотя бы одну пачку отправить не удалось
+def flush_apartments(apartments):
+    success = True
+    created = 0
+    for start in range(0, len(apartments), BULK_SIZE):
+        batch = apartments[start:start + BULK_SIZE]
+        try:
+            response = invokeBulkPost(json.dumps([apartment.toDict() for apartment in batch]))
+        except requests.RequestException as e:
+            logger.error(f'Ошибка отправки объявлений: {str(e)}')
+            success = False
+            continue
 
+        if response.status_code != 200:
+            logger.error(f'Возникла ошибка: {response.status_code} {response.content}')
+            success = False
+            continue
 
-def setup_driver():
-    options = webdriver.ChromeOptions()
-    options.add_argument('--no-sandbox')
-    options.add_argument('--headless')
-    options.add_argument('--log-level=3')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    prefs = {"profile.managed_default_content_settings.images": 2}
-    options.add_experimental_option("prefs", prefs)
-    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        result = response.json()
+        # Объявление есть в API, если оно создано, обновлено или не изменилось
+        stored = [batch[item['index']] for item in result['results']
+                  if item['status'] in ('created', 'updated', 'unchanged')]
+        seen_cache.add_many(SRC, [(apartment.internalId, apartment.fields_hash())
+                                  for apartment in stored])
+        created += result['created']
+        logger.info(f"Объявлений опубликовано: {result['created']}, "
+                    f"обновлено: {result['updated']}, без изменений: {result['unchanged']}, "
+                    f"с ошибками: {result['errored']}")
+        for item in result['results']:
+            apartment = batch[item['index']]
+            if item['status'] == 'created':
+                logger.info('Запись опубликована: ' + apartment.convertToJson())
+            elif item['status'] == 'errored':
+                logger.error(f"Возникла ошибка: {item['errors']}\n{apartment.convertToJson()}")
+    return created, success
 
 
 def monitor_resources():
     memory = psutil.virtual_memory()
     logger.info(f'Использование памяти: {memory.percent}%')
-    cpu = psutil.cpu_percent(interval=1)
+    # Без блокирующего интервала: загрузка с момента предыдущего вызова
+    cpu = psutil.cpu_percent(interval=None)
     logger.info(f'Использование CPU: {cpu}%')
 
 
+# Количество новых объявлений по сегментам за текущий обход
+new_listings = {}
+new_listings_lock = threading.Lock()
+
+
+# Объявление уже отправлено в API, и его цена, фото и другие изменяемые
+# поля с тех пор не поменялись. Изменившееся отправляется повторно,
+# и API обновляет его на месте
+def is_known(apartment):
+    return seen_cache.is_unchanged(SRC, apartment.internalId, apartment.fields_hash())
+
+
+# Возвращает количество созданных в API объявлений со страницы
+# и признак успешной отправки новых и изменившихся объявлений
+def process_listings(page_source, avd_type, grad):
+    result = extract_listings(page_source, avd_type, BASE_URL, today_start,
+                              is_known=is_known)
+    logger.info(f'Разбор страницы: {result.elapsed * 1000:.1f} мс, '
+                f'объявлений: {result.total}, новых или измененных: {len(result.apartments)}')
+    for index, field in result.errors:
+        logger.error(f'Не удалось разобрать поле {field} объявления {index}')
+
+    created, posted = flush_apartments(result.apartments)
+    with new_listings_lock:
+        key = (avd_type, grad)
+        new_listings[key] = new_listings.get(key, 0) + created
+    return created, posted
+
+
+# Обработка одной страницы сегмента с повторными попытками
+# Возвращает False, если на странице нет новых объявлений
+def scrape_page(avd_type, grad, page):
+    tryies = 0
+    while True:
+        logger.info(f'{avd_type}/{grad}: страница {page}')
+        try:
+            key = f'{avd_type}/{grad}/{page}'
+            old_fingerprint, etag, last_modified = page_state.get(key)
+            result = fetcher.fetch(SEARCH_URL.format(avd_type, grad, page),
+                                   etag=etag, last_modified=last_modified)
+            if result is None:
+                return False
+
+            # Страница не изменилась с прошлого запуска: все объявления
+            # на ней уже обработаны, дальше по сегменту идти незачем
+            if result.not_modified:
+                logger.info(f'{key}: страница не изменилась (304)')
+                return False
+            new_fingerprint = fingerprint(result.html)
+            if new_fingerprint is not None and new_fingerprint == old_fingerprint:
+                logger.info(f'{key}: страница не изменилась')
+                return False
+
+            new, posted = process_listings(result.html, avd_type, grad)
+            # Отпечаток сохраняется только после успешной отправки, иначе
+            # неотправленные объявления были бы пропущены при следующем запуске
+            if posted:
+                page_state.set(key, new_fingerprint, result.etag, result.last_modified)
+            # Без ответа API неизвестно, были ли на странице новые объявления
+            if posted and new == 0:
+                logger.info(f'{key}: нет новых объявлений')
+                return False
+            return True
+        except Exception as e:
+            logger.error(f'Ошибка загрузки страницы {page}: {str(e)}')
+            # Возможны глюки с драйвером при нехватке ресурсов,
+            # сбойный браузер пул пересоздаст
+            # 3 попытки, повторная попытка через 5 секунд
+            tryies += 1
+            if tryies > 2:
+                return True
+            time.sleep(5)
+        finally:
+            monitor_resources()
+
+
+# Обход сегментов по отдельному расписанию, подстраиваемому под поток
+# новых объявлений, вместо полного обхода раз в 40 минут по cron
+def run_daemon():
+    global today_start
+    schedule = AdaptiveScheduler(segments, min_interval=DAEMON_MIN_INTERVAL,
+                                 max_interval=DAEMON_MAX_INTERVAL,
+                                 target_new=DAEMON_TARGET_NEW)
+    while True:
+        today_start = datetime.combine(date.today(), datetime.min.time())
+
+        due = schedule.due(time.time())
+        with new_listings_lock:
+            new_listings.clear()
+        scheduler.run([(segment.avd_type, segment.grad) for segment in due])
+
+        now = time.time()
+        for segment in due:
+            schedule.record(segment, new_listings.get((segment.avd_type, segment.grad), 0), now)
+        seen_cache.evict()
+        schedule.sleep_until_due()
+
+
 today_start = datetime.combine(date.today(), datetime.min.time())
 logger.info('Загрузка данных: ' + today_start.strftime('%d.%m.%Y %H:%M:%S'))
 logger.info('Агрегатор: ' + BASE_URL)
 
-for avd_type in adv_types:
-    logger.info('Тип недвижимости: ' + avd_type.upper())
-    for grad in cities:
-        i = 0
-        logger.info('Город: ' + grad.upper())
-
-        while i < NUMBER_OF_PAGES:
-            i += 1
-            logger.info('Страница {0}'.format(i))
-
-            driver = setup_driver()
-            tryies = 0
-            try:
-                # !!! Разбить на отдельные методы
-                tryies += 1
-                driver.get(SEARCH_URL.format(avd_type, grad, i))
-                driver.implicitly_wait(10)
-                wait_for_images(driver=driver, tag='img.resized-image')
-
-                if 'product-list' in driver.page_source:
-                    page_source = driver.page_source
-                    wait_for_images(driver=driver, tag='div.product-item:not(.banner-list)')
-
-                    soup = BeautifulSoup(page_source, 'html.parser')
-                    listings = soup.select('div.product-item:not(.banner-list)')
-                    for listing in listings:
-                        try:
-                            sub_url = ''
-                            publish_date = datetime.strptime(
-                                listing.find('span', class_='publish-date').
-                                get_text(strip=True), '%d.%m.%Y.'
-                            )
-
-                            if publish_date >= today_start:
-                                product_tag = listing.find(class_='product-title')
-                                if product_tag:
-                                    sub = product_tag.find('a')
-                                    product_title = product_tag.find('a').get_text(strip=True)
-                                    if sub:
-                                        sub_url = BASE_URL + sub['href']
-
-                                if sub_url == '':
-                                    continue
-                                
-                                image_tag = listing.find(class_='resized-image')
-                                image_url = image_tag['src'] if image_tag else ''
-
-                                product_features = listing.find('ul', class_='product-features')
-                                size = product_features.find('div', class_='value-wrapper').contents[0].strip().replace(' m', '')
-                                rooms = product_features.find_all('div', class_='value-wrapper')[1].contents[0].strip()
-                                price = listing.find('div', class_='central-feature-wrapper').find('span', {'data-value': True})['data-value']
-                                reporter = listing.find('span', class_='basic-info').get_text(strip=True)
-                                internalId = sub_url.split('/')[-1].split('?')[0]
-
-                                belgrade_tz = pytz.timezone('Europe/Belgrade')
-                                insertedAt = datetime.now(belgrade_tz)
-                                published = insertedAt.strftime('%d.%m.%Y. u %H:%M')
-
-                                subtitle_places = listing.find('ul', class_='subtitle-places').find_all('li')
-                                city = subtitle_places[0].get_text(strip=True)
-                                district = subtitle_places[1].get_text(strip=True)
-
-                                type = ''
-                                if avd_type == 'izdavanje-stanova':
-                                    type = 'stan'
-                                elif avd_type == 'izdavanje-kuca':
-                                    type = 'kuća'
-                                
-                                apartment = Apartment(city=city, district=district,
-                                                      price=price, currency='€',
-                                                      type=type, rooms=rooms, size=size,
-                                                      reporter=reporter, published=published,
-                                                      internalId=internalId, src='halooglasi',
-                                                      image_url=image_url, url=sub_url)
-                                response = invokePost(apartment.convertToJson())
-                                if response.status_code == 201:
-                                    logger.info('Запись опубликована: ' + apartment.convertToJson())
-                                else:
-                                    logger.error(
-                                        f'Возникла ошибка: {response.content}\n{apartment.convertToJson()}'
-                                    )
-                        except Exception as e:
-                            logger.error(f'Ошибка: {str(e)}')
-                            continue
-                else:
-                    break
-            except Exception as e:
-                logger.error(f'Ошибка загрузки страницы {i}: {str(e)}')
-                # Возможны глюки с драйвером при нехватке ресурсов
-                # Повторная попытка через 5 секунд
-                time.sleep(5)
-                # 3 попытки
-                if (tryies > 2):
-                    continue
-                i -= 1
-                continue
-            finally:
-                driver.quit()
-                monitor_resources()
+seen_cache = SeenCache(SEEN_CACHE_PATH, ttl=SEEN_CACHE_TTL)
+seen_cache.evict()
+page_state = PageState(SEEN_CACHE_PATH)
+
+# Браузеры запускаются один раз за запуск и переиспользуются между страницами,
+# и только если страницу не удалось получить обычным HTTP-запросом
+pool = DriverPool(size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES)
+fetcher = PageFetcher(pool, rate_limiter=HostRateLimiter(HOST_RATE_LIMIT),
+                      http_pool_size=CONCURRENCY)
+scheduler = PageScheduler(scrape_page, concurrency=CONCURRENCY,
+                          max_pages=NUMBER_OF_PAGES)
+
+try:
+    if args.daemon:
+        run_daemon()
+    else:
+        scheduler.run(segments)
+finally:
+    fetcher.close()
+    pool.close()
+    seen_cache.close()
+    page_state.close()
+    run_lock.release()
 
 logger.info('Загрузка завершена')
@@ -0,0 +1,39 @@
+import sqlite3
+import threading
+import time
+
+
+# Состояние страниц результатов с прошлого запуска: отпечаток списка
+# объявлений и валидаторы HTTP-кэша для каждой (тип, город, страница)
+class PageState:
+    def __init__(self, path) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'key TEXT PRIMARY KEY, fingerprint TEXT, etag TEXT, '
+            'last_modified TEXT, updated_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    # Возвращает (fingerprint, etag, last_modified)
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT fingerprint, etag, last_modified FROM pages WHERE key = ?', (key,)
+            ).fetchone()
+        return row if row is not None else (None, None, None)
+
+    def set(self, key, fingerprint, etag=None, last_modified=None):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (key, fingerprint, etag, last_modified, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, fingerprint, etag, last_modified, time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+logger = logging.getLogger()
+
+
+# Ограничение частоты запросов к одному хосту (запросов в секунду)
+class HostRateLimiter:
+    def __init__(self, rate) -> None:
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Сегмент обхода: тип объявлений + город
+class Segment:
+    def __init__(self, avd_type, grad, max_pages) -> None:
+        self.avd_type = avd_type
+        self.grad = grad
+        self.next_page = 1
+        self.last_page = max_pages
+        self.in_flight = 0
+
+    def has_pages(self):
+        return self.next_page <= self.last_page
+
+    def __str__(self) -> str:
+        return f'{self.avd_type}/{self.grad}'
+
+
+# Параллельный обход страниц (тип, город, страница) пулом потоков.
+# handle_page(avd_type, grad, page) возвращает False, если на странице
+# нет (новых) объявлений: страницы сегмента дальше нее не запрашиваются
+class PageScheduler:
+    def __init__(self, handle_page, concurrency=4, max_pages=40) -> None:
+        self.handle_page = handle_page
+        self.concurrency = max(1, concurrency)
+        self.max_pages = max_pages
+
+    def run(self, segments):
+        segments = [Segment(avd_type, grad, self.max_pages)
+                    for avd_type, grad in segments]
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                while len(in_flight) < self.concurrency:
+                    segment = self._next_segment(segments)
+                    if segment is None:
+                        break
+                    page = segment.next_page
+                    segment.next_page += 1
+                    segment.in_flight += 1
+                    future = executor.submit(self.handle_page,
+                                             segment.avd_type, segment.grad, page)
+                    in_flight[future] = (segment, page)
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    segment, page = in_flight.pop(future)
+                    segment.in_flight -= 1
+                    try:
+                        has_more = future.result()
+                    except Exception as e:
+                        logger.error(f'Ошибка обработки {segment}, страница {page}: {str(e)}')
+                        has_more = True
+
+                    if not has_more and page - 1 < segment.last_page:
+                        segment.last_page = page - 1
+                        logger.info(f'{segment}: последняя страница {segment.last_page}')
+
+    # Сегмент с наименьшим числом страниц в работе, чтобы
+    # не забегать далеко вперед за последнюю страницу
+    @staticmethod
+    def _next_segment(segments):
+        candidates = [segment for segment in segments if segment.has_pages()]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda segment: segment.in_flight)
@@ -0,0 +1,63 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+# Память парсера между запусками: объявления (src, internalId), которые
+# уже были отправлены в API, и хэш их изменяемых полей на момент отправки.
+# Хранится на диске в sqlite, записи старше ttl секунд удаляются, поэтому
+# размер не растет вместе с историей
+class SeenCache:
+    def __init__(self, path, ttl=7 * 24 * 60 * 60) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS seen ('
+            'src TEXT NOT NULL, internal_id TEXT NOT NULL, seen_at REAL NOT NULL, '
+            'PRIMARY KEY (src, internal_id)) WITHOUT ROWID'
+        )
+        # Кэш, созданный до появления хэша полей: записи без хэша
+        # считаются измененными и будут отправлены повторно один раз
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(seen)')}
+        if 'fields_hash' not in columns:
+            self._conn.execute('ALTER TABLE seen ADD COLUMN fields_hash TEXT')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS seen_at_idx ON seen (seen_at)')
+        self._conn.commit()
+
+    # Объявление уже отправлено в API с теми же значениями изменяемых полей
+    def is_unchanged(self, src, internal_id, fields_hash):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM seen WHERE src = ? AND internal_id = ? AND fields_hash = ? '
+                'AND seen_at >= ?',
+                (src, internal_id, fields_hash, time.time() - self.ttl)
+            ).fetchone()
+        return row is not None
+
+    # items - пары (internalId, хэш изменяемых полей)
+    def add_many(self, src, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO seen (src, internal_id, seen_at, fields_hash) '
+                'VALUES (?, ?, ?, ?)',
+                [(src, internal_id, now, fields_hash) for internal_id, fields_hash in items]
+            )
+            self._conn.commit()
+
+    def evict(self):
+        with self._lock:
+            deleted = self._conn.execute(
+                'DELETE FROM seen WHERE seen_at < ?', (time.time() - self.ttl,)
+            ).rowcount
+            self._conn.commit()
+        logger.info(f'Удалено устаревших записей кэша: {deleted}')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,4 +1,17 @@
 #!/bin/sh
 
 cd /app/rentbot_django_api
-gunicorn rentbot_django_api.wsgi:application --bind 0.0.0.0:8000
\ No newline at end of file
+
+# API_SERVER_MODE: sync (по умолчанию) - WSGI с синхронными воркерами,
+# async - ASGI через uvicorn-воркеры gunicorn. В нагрузочном тесте
+# (loadtest.py, результаты в Readme) асинхронный режим оказался медленнее
+# API_WORKERS: число процессов, по умолчанию по числу CPU
+export API_SERVER_MODE=${API_SERVER_MODE:-sync}
+WORKERS=${API_WORKERS:-$(nproc)}
+
+if [ "$API_SERVER_MODE" = "async" ]; then
+    exec gunicorn rentbot_django_api.asgi:application --bind 0.0.0.0:8000 --workers "$WORKERS" \
+        --worker-class uvicorn.workers.UvicornWorker
+else
+    exec gunicorn rentbot_django_api.wsgi:application --bind 0.0.0.0:8000 --workers "$WORKERS"
+fi